@@ -3,6 +3,22 @@ import { ConfigService } from '@nestjs/config';
 import { InjectLogger } from '@suggar-daddy/common';
 import type { NsfwResult } from '@suggar-daddy/moderation';
 
+// 429 = worker queue full, 503 = model still loading; both send Retry-After
+const BUSY_STATUSES = new Set([429, 503]);
+const MAX_BUSY_RETRIES = 3;
+const MAX_RETRY_DELAY_MS = 10000;
+
+/**
+ * The ML service is up but shedding load. Not a verdict on the image, so it
+ * must not fail open; callers retry the whole moderation step instead.
+ */
+export class NsfwServiceBusyError extends Error {
+  constructor(status: number) {
+    super(`NSFW API busy (${status}) after ${MAX_BUSY_RETRIES} retries`);
+    this.name = 'NsfwServiceBusyError';
+  }
+}
+
 @Injectable()
 export class NsfwClientService {
   @InjectLogger() private readonly logger!: Logger;
@@ -15,12 +31,7 @@ export class NsfwClientService {
   async checkImage(imageUrl: string): Promise<NsfwResult> {
     const startTime = Date.now();
     try {
-      const response = await fetch(`${this.mlServiceUrl}/api/moderation/nsfw`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ image_url: imageUrl }),
-        signal: AbortSignal.timeout(15000),
-      });
+      const response = await this.post('/api/moderation/nsfw', { image_url: imageUrl }, 15000);
 
       if (!response.ok) {
         throw new Error(`NSFW API returned ${response.status}`);
@@ -34,21 +45,95 @@ export class NsfwClientService {
         processingTimeMs: data.processing_time_ms,
       };
     } catch (error) {
+      if (error instanceof NsfwServiceBusyError) throw error;
       this.logger.warn(`NSFW check failed for ${imageUrl}: ${error}`);
-      // Fail open: treat as safe if service unavailable
+      return this.failOpen(startTime);
+    }
+  }
+
+  async checkImages(imageUrls: string[]): Promise<NsfwResult[]> {
+    if (imageUrls.length <= 1) {
+      return Promise.all(imageUrls.map((url) => this.checkImage(url)));
+    }
+
+    // One call for the whole album; the ML service scores it in shared model passes
+    const startTime = Date.now();
+    let data: { results?: { result?: any; error?: string; retryable?: boolean }[] };
+    try {
+      const response = await this.post(
+        '/api/moderation/nsfw/batch',
+        { images: imageUrls.map((url) => ({ image_url: url })) },
+        30000,
+      );
+
+      if (!response.ok) {
+        throw new Error(`NSFW batch API returned ${response.status}`);
+      }
+      data = await response.json();
+    } catch (error) {
+      if (error instanceof NsfwServiceBusyError) throw error;
+      this.logger.warn(`NSFW batch check failed for ${imageUrls.length} images: ${error}`);
+      return imageUrls.map(() => this.failOpen(startTime));
+    }
+
+    return Promise.all(imageUrls.map(async (url, i) => {
+      const item = data.results?.[i];
+      if (item?.retryable) {
+        // Shed by admission control mid-batch: score it on its own (with backoff)
+        return this.checkImage(url);
+      }
+      if (!item?.result) {
+        this.logger.warn(`NSFW check failed for ${url}: ${item?.error ?? 'missing result'}`);
+        return this.failOpen(startTime);
+      }
       return {
-        nsfwScore: 0,
-        category: 'safe',
-        safe: true,
-        processingTimeMs: Date.now() - startTime,
+        nsfwScore: item.result.nsfw_score,
+        category: item.result.category,
+        safe: item.result.safe,
+        processingTimeMs: item.result.processing_time_ms,
       };
+    }));
+  }
+
+  /**
+   * POST to the ML service, retrying 429/503 with exponential backoff that
+   * honours Retry-After. Throws NsfwServiceBusyError once retries run out.
+   */
+  private async post(path: string, body: unknown, timeoutMs: number): Promise<Response> {
+    for (let attempt = 0; ; attempt++) {
+      const response = await fetch(`${this.mlServiceUrl}${path}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+        signal: AbortSignal.timeout(timeoutMs),
+      });
+      if (!BUSY_STATUSES.has(response.status)) {
+        return response;
+      }
+      if (attempt >= MAX_BUSY_RETRIES) {
+        throw new NsfwServiceBusyError(response.status);
+      }
+      const delayMs = this.retryDelayMs(response.headers.get('Retry-After'), attempt);
+      this.logger.debug(`NSFW API busy (${response.status}), retrying in ${delayMs}ms`);
+      await new Promise((resolve) => setTimeout(resolve, delayMs));
     }
   }
 
-  async checkImages(imageUrls: string[]): Promise<NsfwResult[]> {
-    const results = await Promise.all(
-      imageUrls.map((url) => this.checkImage(url)),
-    );
-    return results;
+  private retryDelayMs(retryAfter: string | null, attempt: number): number {
+    const seconds = Number(retryAfter);
+    const hinted = Number.isFinite(seconds) && seconds > 0 ? seconds * 1000 : 0;
+    const backoff = Math.pow(2, attempt) * 500;
+    // Jitter so a burst of callers doesn't come back in lockstep
+    return Math.min(MAX_RETRY_DELAY_MS, Math.max(hinted, backoff)) * (1 + Math.random() * 0.2);
+  }
+
+  private failOpen(startTime: number): NsfwResult {
+    // Fail open: treat as safe only if the service is unreachable or erroring
+    return {
+      nsfwScore: 0,
+      category: 'safe',
+      safe: true,
+      processingTimeMs: Date.now() - startTime,
+    };
   }
 }
@@ -6,6 +6,7 @@ import axios from 'axios';
 export interface MlRecommendation {
   userId: string;
   score: number;
+  coldStart?: boolean;
 }
 
 @Injectable()
@@ -14,6 +15,9 @@ export class MlClientService {
   private readonly baseUrl: string;
   private readonly ML_RECS_PREFIX = 'ml_recs:';
   private readonly ML_RECS_TTL = 3600; // 1 hour
+  // Cold-start lists stand in until the user's first embedding; cap their TTL so
+  // personalized results show up soon after training or an embedding update
+  private readonly ML_COLD_START_TTL = 60;
   private readonly REQUEST_TIMEOUT = 2000; // 2 seconds
 
   constructor(
@@ -59,10 +63,13 @@ export class MlClientService {
 
       // Cache the result
       if (recs.length > 0) {
+        const coldStart =
+          res.headers['x-recommendation-source'] === 'cold_start' ||
+          recs.some((r) => r.coldStart);
         await this.redisService.set(
           cacheKey,
           JSON.stringify(recs),
-          this.ML_RECS_TTL,
+          coldStart ? this.coldStartTtl(res.headers['cache-control']) : this.ML_RECS_TTL,
         );
       }
 
@@ -76,6 +83,12 @@ export class MlClientService {
     }
   }
 
+  private coldStartTtl(cacheControl: unknown): number {
+    const maxAge = /max-age=(\d+)/.exec(String(cacheControl ?? ''));
+    const seconds = maxAge ? Number(maxAge[1]) : this.ML_COLD_START_TTL;
+    return Math.max(1, Math.min(seconds, this.ML_COLD_START_TTL));
+  }
+
   async getHealth(): Promise<boolean> {
     try {
       const res = await axios.get(`${this.baseUrl}/health`, {
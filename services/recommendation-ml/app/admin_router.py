@@ -0,0 +1,99 @@
+import hmac
+import logging
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from .config import settings
+from .coordination import coordinated_train, get_lease_info, training_lease
+from .database import convert_storage
+from .profiling import (
+    get_artifact_path,
+    get_report,
+    list_reports,
+    profile_in_background,
+    start_request_window,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    """Guard admin endpoints with a shared token; closed when none is configured."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if not hmac.compare_digest(x_admin_token.encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+admin_router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@admin_router.get("/training/lease")
+async def training_lease_status():
+    """Show which node holds the training lease and the current model generation."""
+    return get_lease_info()
+
+
+@admin_router.post("/embedding-storage")
+def embedding_storage_convert():
+    """
+    Convert user_embeddings to EMBEDDING_STORAGE and rebuild its indexes.
+    Holds the training lease so it never overlaps training or another
+    conversion; the table is locked for the rewrite, so run it off-peak.
+    """
+    with training_lease() as acquired:
+        if not acquired:
+            raise HTTPException(status_code=409, detail="Training lease is held by another node")
+        converted = convert_storage()
+    logger.info(f"Embedding storage conversion: {converted or 'already up to date'}")
+    return {"storage": settings.embedding_storage, "converted": converted}
+
+
+@admin_router.post("/profiles/training", status_code=202)
+async def profile_training():
+    """Run a (lease-coordinated) training job under cProfile + tracemalloc."""
+    try:
+        report = profile_in_background("training", lambda: coordinated_train("profile"))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"id": report["id"], "status": report["status"]}
+
+
+@admin_router.post("/profiles/requests", status_code=202)
+async def profile_requests(seconds: float = Query(default=30, gt=0)):
+    """Profile live requests served by this replica for a time window."""
+    seconds = min(seconds, settings.profile_max_window_seconds)
+    try:
+        report = start_request_window(seconds)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"id": report["id"], "status": report["status"], "seconds": seconds}
+
+
+@admin_router.get("/profiles")
+async def profiles():
+    """List profile reports held by this replica."""
+    return list_reports()
+
+
+@admin_router.get("/profiles/{report_id}")
+async def profile_report(report_id: str):
+    """Top functions by cumulative time and top allocation sites."""
+    report = get_report(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
+
+
+@admin_router.get("/profiles/{report_id}/download")
+async def profile_download(report_id: str):
+    """Download the raw pstats dump (open with `python -m pstats` or snakeviz)."""
+    path = get_artifact_path(report_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found or still running")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{report_id}.prof")
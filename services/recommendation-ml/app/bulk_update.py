@@ -0,0 +1,125 @@
+"""
+Bulk embedding refresh jobs (POST /update-embeddings).
+
+A job walks its users in chunks of `bulk_update_chunk_size`; each chunk is
+one connection (batched feature queries, one upsert) followed by one
+pipelined pass over the chunk's cached ranked lists. Jobs run one at a time
+per replica on a background thread; progress is kept in Redis so any
+replica can report it.
+"""
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, Optional
+
+from .config import settings
+from .coordination import NODE_ID
+from .database import get_cursor
+from .engine import update_embeddings
+from .metrics import BULK_UPDATE_USERS
+from .ranked_list import invalidate_ranked_lists
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "ml_bulk_job:"
+_MIN_UUID = "00000000-0000-0000-0000-000000000000"
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-update")
+
+
+def _save(job_id: str, **fields):
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hset(PREFIX + job_id, mapping={k: "" if v is None else v for k, v in fields.items()})
+    pipe.expire(PREFIX + job_id, settings.bulk_update_job_ttl)
+    pipe.execute()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Progress of a job started on any replica; None if unknown or expired."""
+    raw = get_redis().hgetall(PREFIX + job_id)
+    if not raw:
+        return None
+    job = {"job_id": job_id, "status": raw["status"], "node": raw["node"], "error": raw.get("error") or None}
+    for key in ("total", "processed", "updated", "missing"):
+        job[key] = int(raw.get(key) or 0)
+    job["elapsed_seconds"] = float(raw.get("elapsed_seconds") or 0)
+    job["users_per_second"] = round(job["processed"] / job["elapsed_seconds"], 1) if job["elapsed_seconds"] else 0.0
+    return job
+
+
+def _count_since(since: datetime) -> int:
+    with get_cursor() as cur:
+        cur.execute('SELECT COUNT(*) AS cnt FROM users WHERE "updatedAt" >= %s', (since,))
+        return cur.fetchone()["cnt"]
+
+
+def _chunks_since(since: datetime, size: int) -> Iterator[list[str]]:
+    """Keyset-paged ids of users updated since `since` (no OFFSET, no full id list in memory)."""
+    last = _MIN_UUID
+    while True:
+        with get_cursor() as cur:
+            cur.execute("""
+                SELECT id::text AS id
+                FROM users
+                WHERE "updatedAt" >= %s AND id > %s::uuid
+                ORDER BY id
+                LIMIT %s
+            """, (since, last, size))
+            ids = [row["id"] for row in cur.fetchall()]
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _run(job_id: str, user_ids: Optional[list[str]], since: Optional[datetime]):
+    size = max(1, settings.bulk_update_chunk_size)
+    if user_ids is not None:
+        chunks = (user_ids[i:i + size] for i in range(0, len(user_ids), size))
+    else:
+        chunks = _chunks_since(since, size)
+
+    started = time.perf_counter()
+    processed = updated = missing = 0
+    _save(job_id, status="running")
+    try:
+        for chunk in chunks:
+            done = update_embeddings(chunk)
+            invalidate_ranked_lists(done)
+            processed += len(chunk)
+            updated += len(done)
+            missing += len(chunk) - len(done)
+            BULK_UPDATE_USERS.labels("updated").inc(len(done))
+            BULK_UPDATE_USERS.labels("missing").inc(len(chunk) - len(done))
+            _save(
+                job_id,
+                processed=processed,
+                updated=updated,
+                missing=missing,
+                elapsed_seconds=round(time.perf_counter() - started, 3),
+            )
+    except Exception as e:
+        logger.error(f"Bulk update job {job_id} failed after {processed} users: {e}")
+        _save(job_id, status="failed", error=str(e)[:500])
+        return
+
+    elapsed = time.perf_counter() - started
+    _save(job_id, status="done", elapsed_seconds=round(elapsed, 3))
+    logger.info(f"Bulk update job {job_id}: {updated} updated, {missing} missing in {elapsed:.1f}s")
+
+
+def start_job(user_ids: Optional[list[str]] = None, updated_since: Optional[datetime] = None) -> dict:
+    """Queue a refresh of the given users, or of every user updated since `updated_since`."""
+    if user_ids is not None:
+        user_ids = list(dict.fromkeys(user_ids))
+        total = len(user_ids)
+    else:
+        total = _count_since(updated_since)
+
+    job_id = uuid.uuid4().hex
+    _save(job_id, status="queued", node=NODE_ID, total=total, processed=0, updated=0, missing=0, error=None)
+    _executor.submit(_run, job_id, user_ids, updated_since)
+    return get_job(job_id)
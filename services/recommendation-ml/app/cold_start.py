@@ -0,0 +1,231 @@
+import heapq
+import logging
+import math
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from .config import settings
+from .database import get_cursor, index_segments
+from .engine import SIGNAL_WEIGHTS, compatible_segments
+from .metrics import COLD_START_REQUESTS
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "ml_cold:"
+KEYS_SET = "ml_cold_keys"  # names of the published lists
+
+AGE_BANDS = [(18, 25), (25, 35), (35, 45), (45, 55), (55, 200)]
+
+# In-memory copy of the Redis lists: key → [(user_id, score 0-1)], best first
+_lists: dict[str, list[tuple[str, float]]] = {}
+# user_id → list keys it appears in (for incremental Kafka updates)
+_member_keys: dict[str, tuple[str, ...]] = {}
+
+
+def _age_band(birth_date: Optional[date], today: date) -> Optional[str]:
+    if not birth_date:
+        return None
+    age = (today - birth_date).days / 365.25
+    for low, high in AGE_BANDS:
+        if low <= age < high:
+            return f"{low}-{high - 1}" if high < 200 else f"{low}+"
+    return None
+
+
+def _list_keys(segment: str, birth_date: Optional[date], today: date) -> list[str]:
+    keys = [segment]
+    band = _age_band(birth_date, today) if settings.cold_start_age_bands else None
+    if band:
+        keys.append(f"{segment}:{band}")
+    return keys
+
+
+def _quality(row: dict, now: datetime) -> float:
+    """0-1 profile quality: verification, photo, bio and how recently active."""
+    score = 0.4 if row.get("verificationStatus") == "verified" else 0.0
+    score += 0.2 if row.get("has_avatar") else 0.0
+    score += 0.1 if row.get("has_bio") else 0.0
+    last_active = row.get("lastActiveAt")
+    if last_active:
+        days = (now - last_active.replace(tzinfo=timezone.utc)).total_seconds() / 86400
+        score += 0.3 * math.exp(-max(days, 0.0) / 7)
+    return score
+
+
+def rank_cold_start(
+    user_rows: Iterable[dict],
+    received_rows: Iterable[dict],
+    now: Optional[datetime] = None,
+) -> dict[str, list[tuple[str, float]]]:
+    """
+    Rank candidates per segment list (no I/O). Score = weighted swipes
+    received (SIGNAL_WEIGHTS) + cold_start_quality_weight * quality, so a
+    Kafka like can later be applied as a plain increment.
+    """
+    now = now or datetime.now(timezone.utc)
+    received: dict[str, float] = defaultdict(float)
+    for row in received_rows:
+        received[str(row["swipedId"])] += SIGNAL_WEIGHTS.get(row["action"], 0.0) * row["n"]
+
+    buckets: dict[str, list[tuple[float, str]]] = defaultdict(list)
+    for row in user_rows:
+        uid = str(row["id"])
+        score = received.get(uid, 0.0) + settings.cold_start_quality_weight * _quality(row, now)
+        for key in _list_keys(row["userType"], row.get("birthDate"), now.date()):
+            buckets[key].append((score, uid))
+
+    size = settings.cold_start_list_size
+    return {
+        key: [(uid, round(score, 4)) for score, uid in heapq.nlargest(size, entries)]
+        for key, entries in buckets.items()
+    }
+
+
+def _publish(lists: dict[str, list[tuple[str, float]]]):
+    """Replace every list in Redis in one MULTI, dropping lists that no longer exist."""
+    r = get_redis()
+    stale = r.smembers(KEYS_SET) - set(lists)
+    pipe = r.pipeline(transaction=True)
+    for key in stale:
+        pipe.delete(PREFIX + key)
+    for key, entries in lists.items():
+        pipe.delete(PREFIX + key)
+        if entries:
+            pipe.zadd(PREFIX + key, dict(entries))
+    pipe.delete(KEYS_SET)
+    if lists:
+        pipe.sadd(KEYS_SET, *lists)
+    pipe.execute()
+
+
+def _load(lists: dict[str, list[tuple[str, float]]]):
+    """Swap in new lists (raw scores, best first), normalized to 0-1 per list."""
+    global _lists, _member_keys
+    normalized, members = {}, defaultdict(list)
+    for key, entries in lists.items():
+        top = entries[0][1] if entries and entries[0][1] > 0 else 1.0
+        normalized[key] = [(uid, max(0.0, min(1.0, score / top))) for uid, score in entries]
+        for uid, _ in entries:
+            members[uid].append(key)
+    _lists = normalized
+    _member_keys = {uid: tuple(keys) for uid, keys in members.items()}
+
+
+def rebuild_cold_start_lists() -> int:
+    """Recompute every list from Postgres, publish to Redis and load locally. Returns list count."""
+    since = datetime.now(timezone.utc) - timedelta(days=settings.cold_start_active_days)
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT id, "userType", "birthDate", "verificationStatus",
+                   "avatarUrl" IS NOT NULL AS has_avatar,
+                   COALESCE(bio, '') <> '' AS has_bio,
+                   "lastActiveAt"
+            FROM users
+            WHERE "userType" = ANY(%s)
+              AND COALESCE("lastActiveAt", "createdAt") > %s
+        """, (index_segments(), since))
+        user_rows = cur.fetchall()
+        cur.execute("""
+            SELECT "swipedId", action, COUNT(*) AS n
+            FROM swipes
+            WHERE "createdAt" > %s
+            GROUP BY "swipedId", action
+        """, (since,))
+        received_rows = cur.fetchall()
+
+    lists = rank_cold_start(user_rows, received_rows)
+    _publish(lists)
+    _load(lists)
+    logger.info(f"Cold-start lists rebuilt: {len(lists)} lists from {len(user_rows)} candidates")
+    return len(lists)
+
+
+def reload_cold_start_lists(_generation: Optional[int] = None):
+    """Refresh the in-memory copy from Redis (reload hook + periodic job)."""
+    r = get_redis()
+    keys = sorted(r.smembers(KEYS_SET))
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.zrevrange(PREFIX + key, 0, settings.cold_start_list_size - 1, withscores=True)
+    _load(dict(zip(keys, pipe.execute())))
+
+
+def record_swipe(swiped_id: str, action: Optional[str]):
+    """
+    Apply one swipe to the lists the swiped user is already in (ZADD XX INCR,
+    so users only enter a list at the next rebuild). Other replicas pick the
+    change up on their next reload.
+    """
+    weight = SIGNAL_WEIGHTS.get(action or "", 0.0)
+    keys = _member_keys.get(swiped_id)
+    if not weight or not keys:
+        return
+    pipe = get_redis().pipeline(transaction=False)
+    for key in keys:
+        pipe.zadd(PREFIX + key, {swiped_id: weight}, xx=True, incr=True)
+    pipe.execute()
+
+
+def _merged(tiers: list[list[str]], skip: set[str], limit: int) -> list[tuple[str, float]]:
+    """Best `limit` candidates, tier by tier; lists within a tier are merged by score."""
+    picked, seen = [], set(skip)
+    for keys in tiers:
+        candidates = []
+        for key in keys:
+            taken = 0
+            for uid, score in _lists.get(key, ()):
+                if uid in seen:
+                    continue
+                candidates.append((score, uid))
+                taken += 1
+                if taken >= limit:
+                    break
+        for score, uid in sorted(candidates, reverse=True):
+            if uid in seen:
+                continue
+            seen.add(uid)
+            picked.append((uid, score))
+            if len(picked) >= limit:
+                return picked
+    return picked
+
+
+def get_cold_start_recommendations(
+    user_id: str,
+    limit: int = 50,
+    exclude_ids: list[str] | None = None,
+) -> list[dict]:
+    """
+    Precomputed candidates for a user with no embedding yet, from the
+    compatible segments' lists (own age band first when enabled).
+    Returns [] for users that do have an embedding.
+    Returns list of {user_id, score, cold_start}.
+    """
+    if not _lists:
+        return []
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT u."userType", u."birthDate", e.user_id IS NOT NULL AS has_embedding
+            FROM users u
+            LEFT JOIN user_embeddings e ON e.user_id = u.id
+            WHERE u.id = %s
+        """, (user_id,))
+        viewer = cur.fetchone()
+    if not viewer or viewer["has_embedding"]:
+        return []
+
+    targets = compatible_segments(viewer["userType"])
+    if targets is None:
+        targets = sorted(key for key in _lists if ":" not in key)
+
+    # The viewer's own age band first (when enabled), then the whole segments
+    tiers = [targets]
+    band = _age_band(viewer["birthDate"], date.today()) if settings.cold_start_age_bands else None
+    if band:
+        tiers.insert(0, [f"{target}:{band}" for target in targets])
+
+    picked = _merged(tiers, set(exclude_ids or []) | {user_id}, limit)
+    COLD_START_REQUESTS.labels("served" if picked else "empty").inc()
+    return [{"user_id": uid, "score": round(score, 4), "cold_start": True} for uid, score in picked]
@@ -0,0 +1,281 @@
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from .cold_start import rebuild_cold_start_lists
+from .config import settings
+from .database import get_connection, get_cursor, get_model_state
+from .engine import train_embeddings
+from .metrics import TRAINING_STAGE_SECONDS
+from .redis_client import invalidate_all_recs
+
+logger = logging.getLogger(__name__)
+
+NODE_ID = settings.node_id or f"{socket.gethostname()}:{os.getpid()}"
+
+# Training outcomes
+TRAINED = "trained"
+BUSY = "busy"        # another replica holds the lease
+STALE = "stale"      # a newer generation appeared while we waited for the lease
+LOST = "lost"        # the lease connection dropped mid-run; nothing was published
+
+# TCP keepalives on the lease connection: a silently dead link is noticed
+# (and the lock counted as lost) within about a minute instead of hours
+LEASE_KEEPALIVES = {"keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 3}
+
+_local_generation: Optional[int] = None
+_generation_lock = threading.Lock()
+_reload_hooks: list[Callable[[int], None]] = []
+
+
+def register_reload_hook(hook: Callable[[int], None]):
+    """Register a callback run with the new generation whenever a model generation is published."""
+    _reload_hooks.append(hook)
+
+
+def get_generation() -> int:
+    """Get the current cluster-wide model generation."""
+    return int(get_model_state().get("generation") or 0)
+
+
+def get_local_generation() -> Optional[int]:
+    """Generation this replica has loaded (None before the first check)."""
+    return _local_generation
+
+
+class Lease:
+    """Result of training_lease(): truthy when acquired."""
+
+    def __init__(self, conn, acquired: bool):
+        self._conn = conn
+        self.acquired = acquired
+
+    def __bool__(self) -> bool:
+        return self.acquired
+
+    def still_held(self) -> bool:
+        """
+        Whether the advisory lock is still held by the lease connection. If
+        that connection dropped, Postgres released the lock and another
+        replica may already be training.
+        """
+        if not self.acquired:
+            return False
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute("""
+                    SELECT 1 FROM pg_locks
+                    WHERE locktype = 'advisory'
+                      AND granted
+                      AND classid = 0
+                      AND objid = %s
+                      AND pid = pg_backend_pid()
+                """, (settings.training_lock_key,))
+                return cur.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Training lease check failed: {e}")
+            return False
+
+
+@contextmanager
+def training_lease():
+    """
+    Try to take the cluster-wide training lease (non-blocking).
+
+    Backed by a session-level Postgres advisory lock held on a dedicated
+    connection, so the lease is released automatically if the holder dies.
+    Yields a Lease, truthy when this node holds the lease; check
+    Lease.still_held() before acting on the result of a long run.
+    """
+    conn = get_connection(**LEASE_KEEPALIVES)
+    conn.autocommit = True
+    acquired = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET application_name = %s", (NODE_ID[:63],))
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (settings.training_lock_key,))
+            acquired = bool(cur.fetchone()[0])
+            if acquired:
+                cur.execute("""
+                    UPDATE ml_model_state
+                    SET lease_holder = %s, lease_acquired_at = now()
+                    WHERE id = 1
+                """, (NODE_ID,))
+        yield Lease(conn, acquired)
+    finally:
+        try:
+            if acquired:
+                with conn.cursor() as cur:
+                    # Only our own marker: after a lost lease another node may hold it
+                    cur.execute("""
+                        UPDATE ml_model_state
+                        SET lease_holder = NULL, lease_acquired_at = NULL
+                        WHERE id = 1 AND lease_holder = %s
+                    """, (NODE_ID,))
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (settings.training_lock_key,))
+        except Exception as e:
+            # A dead lease connection has already released the lock server-side
+            logger.warning(f"Training lease release failed: {e}")
+        finally:
+            conn.close()
+
+
+def _lease_holder(cur) -> Optional[dict]:
+    # Read from pg_locks, so a crashed node never shows as holder
+    cur.execute("""
+        SELECT a.application_name AS node_id, a.client_addr, a.backend_start
+        FROM pg_locks l
+        JOIN pg_stat_activity a ON a.pid = l.pid
+        WHERE l.locktype = 'advisory'
+          AND l.granted
+          AND l.classid = 0
+          AND l.objid = %s
+        LIMIT 1
+    """, (settings.training_lock_key,))
+    return cur.fetchone()
+
+
+def lease_held() -> bool:
+    """True while some replica holds the training lease."""
+    with get_cursor() as cur:
+        return _lease_holder(cur) is not None
+
+
+def get_lease_info() -> dict:
+    """
+    Describe who currently holds the training lease.
+    The holder is read from pg_locks, so a crashed node never shows as holder.
+    """
+    with get_cursor() as cur:
+        holder = _lease_holder(cur)
+        cur.execute("SELECT * FROM ml_model_state WHERE id = 1")
+        state = cur.fetchone() or {}
+
+    acquired_at = state.get("lease_acquired_at") if holder and state.get("lease_holder") == holder["node_id"] else None
+    return {
+        "held": holder is not None,
+        "holder": holder["node_id"] if holder else None,
+        "holder_addr": str(holder["client_addr"]) if holder and holder["client_addr"] else None,
+        "acquired_at": acquired_at,
+        "this_node": NODE_ID,
+        "generation": int(state.get("generation") or 0),
+        "local_generation": _local_generation,
+        "trained_by": state.get("trained_by"),
+        "trained_at": state.get("trained_at"),
+    }
+
+
+def _publish_generation() -> int:
+    """Bump the model generation after a successful training run."""
+    with get_cursor() as cur:
+        cur.execute("""
+            UPDATE ml_model_state
+            SET generation = generation + 1, trained_by = %s, trained_at = now()
+            WHERE id = 1
+            RETURNING generation
+        """, (NODE_ID,))
+        return int(cur.fetchone()["generation"])
+
+
+def _apply_generation(generation: int):
+    """Run reload hooks once per generation on this replica."""
+    global _local_generation
+    with _generation_lock:
+        if _local_generation == generation:
+            return
+        previous = _local_generation
+        _local_generation = generation
+    for hook in _reload_hooks:
+        try:
+            hook(generation)
+        except Exception as e:
+            logger.error(f"Reload hook {getattr(hook, '__name__', hook)} failed: {e}")
+    if previous is not None:
+        logger.info(f"Loaded model generation {generation} (was {previous})")
+
+
+def check_generation() -> int:
+    """Poll the shared generation and reload if another replica published a new one."""
+    generation = get_generation()
+    _apply_generation(generation)
+    return generation
+
+
+def wait_for_generation(after: int, timeout: float = 0) -> bool:
+    """
+    Block until a generation newer than `after` is published. Gives up
+    (False) on timeout, or as soon as the training lease is free: the run we
+    were waiting for has finished, and if it published nothing (too little
+    data, or it failed) no generation is coming.
+    """
+    timeout = timeout or settings.training_wait_timeout_seconds
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check_generation() > after:
+            return True
+        if not lease_held():
+            # Re-check: the leader may have published just before releasing
+            return check_generation() > after
+        time.sleep(2)
+    return False
+
+
+def _recently_trained(within_seconds: float) -> bool:
+    """True if any replica published a generation within the last `within_seconds`."""
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT trained_at > now() - make_interval(secs => %s) AS fresh
+            FROM ml_model_state WHERE id = 1
+        """, (within_seconds,))
+        row = cur.fetchone()
+        return bool(row and row["fresh"])
+
+
+def coordinated_train(
+    trigger: str,
+    expected_generation: Optional[int] = None,
+    skip_if_trained_within: float = 0,
+) -> tuple[str, int, float]:
+    """
+    Train only if this replica wins the training lease.
+
+    `expected_generation` is the generation the caller saw when it decided to
+    train; if a newer one has been published since, the run is skipped. Cron
+    runs also pass `skip_if_trained_within` so a replica whose job fires late
+    doesn't retrain right after the leader finished.
+    Returns (status, updated_count, duration_seconds).
+    """
+    with training_lease() as leader:
+        if not leader:
+            logger.info(f"Training ({trigger}) skipped: lease held by another replica")
+            return BUSY, 0, 0.0
+
+        current = get_generation()
+        if (expected_generation is not None and current != expected_generation) or (
+            skip_if_trained_within and _recently_trained(skip_if_trained_within)
+        ):
+            logger.info(f"Training ({trigger}) skipped: generation {current} is already fresh")
+            _apply_generation(current)
+            return STALE, 0, 0.0
+
+        logger.info(f"Training ({trigger}) started on {NODE_ID}")
+        count, duration = train_embeddings()
+        try:
+            # Independent of the embeddings: new apps have users before enough swipes
+            with TRAINING_STAGE_SECONDS.labels("cold_start").time():
+                rebuild_cold_start_lists()
+        except Exception as e:
+            logger.error(f"Cold-start list rebuild failed: {e}")
+        if count > 0:
+            if not leader.still_held():
+                logger.error(f"Training ({trigger}) lost the lease mid-run; not publishing a generation")
+                return LOST, count, duration
+            generation = _publish_generation()
+            invalidate_all_recs()
+            _apply_generation(generation)
+
+    return TRAINED, count, duration
@@ -0,0 +1,279 @@
+"""
+Co-visitation candidates: "people who liked X also liked Y".
+
+Built at training time from the interaction matrix. With L the binary
+likes matrix (user x profile), profile-profile co-likes are Lᵀ·L; each
+profile keeps its `covisit_neighbors` strongest links (cosine-normalized,
+at least `covisit_min_count` co-likes). A user's candidates are then
+L·N over those links, minus profiles they already interacted with and
+segments they can't be matched with. Both products run in row blocks on a
+process pool, so neither full product is ever materialized.
+"""
+import heapq
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+from .config import settings
+from .database import get_cursor
+from .metrics import COVISIT_BYTES
+from .redis_client import decode_ranked, encode_records, get_binary_redis
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "ml_covisit:"
+CURRENT_KEY = "ml_covisit:current"  # build id whose lists are served
+
+# Matrices shared with block workers, set once per process by _init_worker
+_shared: dict = {}
+
+
+def _init_worker(shared: dict):
+    _shared.clear()
+    _shared.update(shared)
+
+
+def _nbytes(matrix: csr_matrix) -> int:
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+def _top_k_rows(block: csr_matrix, k: int) -> csr_matrix:
+    """Keep the k largest entries of each row."""
+    rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+    order = np.lexsort((-block.data, rows))
+    rank = np.arange(len(order)) - block.indptr[rows[order]]
+    keep = order[rank < k]
+    return csr_matrix((block.data[keep], (rows[keep], block.indices[keep])), shape=block.shape)
+
+
+def _neighbor_block(start: int, stop: int) -> csr_matrix:
+    """Rows start:stop of the pruned profile-profile link matrix."""
+    likes, likes_t, popularity = _shared["likes"], _shared["likes_t"], _shared["popularity"]
+    co = (likes_t[start:stop] @ likes).tocsr()
+    rows = np.repeat(np.arange(stop - start), np.diff(co.indptr))
+    keep = (co.data >= _shared["min_count"]) & (co.indices != rows + start)
+    rows, cols = rows[keep], co.indices[keep]
+    weights = co.data[keep] / np.sqrt(popularity[rows + start] * popularity[cols])
+    block = csr_matrix((weights, (rows, cols)), shape=co.shape)
+    return _top_k_rows(block, _shared["neighbors"])
+
+
+def _candidate_block(start: int, stop: int) -> csr_matrix:
+    """Rows start:stop of the per-user candidate matrix."""
+    scores = (_shared["likes"][start:stop] @ _shared["links"]).tocsr()
+    # Drop profiles the user already swiped on or viewed
+    scores = scores - scores.multiply(_shared["interacted"][start:stop])
+    scores.eliminate_zeros()
+    rows = np.repeat(np.arange(stop - start), np.diff(scores.indptr))
+    codes = _shared["segment_codes"]
+    keep = (scores.indices != rows + start) & _shared["allowed"][codes[rows + start], codes[scores.indices]]
+    block = csr_matrix((scores.data[keep], (rows[keep], scores.indices[keep])), shape=scores.shape)
+    return _top_k_rows(block, _shared["candidates"])
+
+
+def _shared_bytes(shared: dict) -> int:
+    """Size of the arrays each spawned worker receives its own copy of."""
+    return sum(
+        _nbytes(v) if isinstance(v, csr_matrix) else v.nbytes
+        for v in shared.values()
+        if isinstance(v, (csr_matrix, np.ndarray))
+    )
+
+
+def _run_blocks(
+    fn: Callable[[int, int], csr_matrix],
+    n_rows: int,
+    shared: dict,
+    workers: int,
+) -> tuple[csr_matrix, int]:
+    """Stack fn's row blocks; returns (matrix, processes used)."""
+    step = max(1, settings.covisit_block_rows)
+    starts = list(range(0, n_rows, step))
+    stops = [min(s + step, n_rows) for s in starts]
+    # Every worker unpickles its own copy of `shared`: cap the pool by the budget
+    per_worker = _shared_bytes(shared)
+    budget = settings.covisit_worker_memory_mb * 2**20
+    workers = min(workers, len(starts), max(1, budget // max(1, per_worker)))
+    if workers <= 1:
+        _init_worker(shared)
+        try:
+            blocks = [fn(a, b) for a, b in zip(starts, stops)]
+        finally:
+            _shared.clear()
+    else:
+        # spawn, not fork: training runs next to the scheduler and Kafka threads
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shared,),
+        ) as pool:
+            blocks = list(pool.map(fn, starts, stops))
+    stacked = vstack(blocks, format="csr") if blocks else csr_matrix((0, 0), dtype=np.float32)
+    return stacked, max(1, workers)
+
+
+def build_candidates(
+    matrix: csr_matrix,
+    segment_codes: np.ndarray,
+    allowed: np.ndarray,
+    workers: int = 0,
+) -> tuple[csr_matrix, dict]:
+    """
+    Per-user co-visitation candidates from the user x user interaction
+    matrix (no I/O). `segment_codes[i]` indexes the boolean `allowed`
+    matrix (viewer segment x candidate segment).
+    Returns (candidates csr: row = user, col = candidate, value = score; stats).
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    likes = (matrix >= settings.covisit_min_signal).astype(np.float32).tocsr()
+    likes.eliminate_zeros()
+    popularity = np.asarray(likes.sum(axis=0)).ravel()
+
+    links_shared = {
+        "likes": likes,
+        "likes_t": likes.T.tocsr(),
+        "popularity": popularity,
+        "min_count": settings.covisit_min_count,
+        "neighbors": settings.covisit_neighbors,
+    }
+    links, links_workers = _run_blocks(_neighbor_block, matrix.shape[0], links_shared, workers)
+    links_s = time.perf_counter() - started
+
+    interacted = (matrix != 0).astype(np.float32).tocsr()
+    candidates_shared = {
+        "likes": likes,
+        "links": links,
+        "interacted": interacted,
+        "segment_codes": segment_codes,
+        "allowed": allowed,
+        "candidates": settings.covisit_candidates,
+    }
+    candidates, candidates_workers = _run_blocks(_candidate_block, matrix.shape[0], candidates_shared, workers)
+
+    stats = {
+        "workers": max(links_workers, candidates_workers),
+        "shared_mb_per_worker": round(max(_shared_bytes(links_shared), _shared_bytes(candidates_shared)) / 2**20, 2),
+        "links_s": round(links_s, 3),
+        "build_s": round(time.perf_counter() - started, 3),
+        "likes_nnz": int(likes.nnz),
+        "links_nnz": int(links.nnz),
+        "links_mb": round(_nbytes(links) / 2**20, 2),
+        "candidates_nnz": int(candidates.nnz),
+        "users_with_candidates": int(np.count_nonzero(np.diff(candidates.indptr))),
+    }
+    return candidates, stats
+
+
+def segment_filter(segments: list[Optional[str]]) -> tuple[np.ndarray, np.ndarray]:
+    """(per-user segment codes, allowed[viewer, candidate]) from settings.segment_compatibility."""
+    names = sorted({s for s in segments if s is not None})
+    code = {name: i for i, name in enumerate(names)}
+    unknown = len(names)
+    allowed = np.ones((unknown + 1, unknown + 1), dtype=bool)
+    for name, i in code.items():
+        targets = settings.segment_compatibility.get(name)
+        if targets is not None:
+            allowed[i] = False
+            for target in targets:
+                if target in code:
+                    allowed[i, code[target]] = True
+    codes = np.array([code.get(s, unknown) for s in segments], dtype=np.int32)
+    return codes, allowed
+
+
+def _publish(candidates: csr_matrix, user_ids: list[str]) -> int:
+    """Write one list per user under a new build id, then switch to it. Returns bytes stored."""
+    ids = np.array([uuid.UUID(str(uid)).bytes for uid in user_ids], dtype="V16")
+    build = str(int(time.time()))
+    r = get_binary_redis()
+    pipe = r.pipeline(transaction=False)
+    stored = 0
+    for row, uid in enumerate(user_ids):
+        lo, hi = candidates.indptr[row], candidates.indptr[row + 1]
+        if lo == hi:
+            continue
+        scores = candidates.data[lo:hi]
+        order = np.argsort(-scores)
+        blob = encode_records(ids[candidates.indices[lo:hi][order]], scores[order] / scores[order[0]])
+        pipe.set(f"{PREFIX}{build}:{uid}", blob, ex=settings.covisit_ttl_seconds)
+        stored += len(blob)
+        if len(pipe) >= 1000:
+            pipe.execute()
+    pipe.execute()
+    # Previous build's lists expire on their own
+    r.set(CURRENT_KEY, build, ex=settings.covisit_ttl_seconds)
+    return stored
+
+
+def rebuild_covisitation(matrix: csr_matrix, user_ids: list[str]) -> dict:
+    """Build and publish co-visitation lists for the training matrix. Returns build stats."""
+    with get_cursor() as cur:
+        cur.execute("SELECT user_id::text AS user_id, segment FROM user_embeddings")
+        segment_of = {row["user_id"]: row["segment"] for row in cur.fetchall()}
+    codes, allowed = segment_filter([segment_of.get(str(uid)) for uid in user_ids])
+
+    candidates, stats = build_candidates(matrix, codes, allowed, settings.covisit_workers)
+    stats["lists_mb"] = round(_publish(candidates, user_ids) / 2**20, 2)
+    COVISIT_BYTES.labels("neighbors").set(stats["links_mb"] * 2**20)
+    COVISIT_BYTES.labels("lists").set(stats["lists_mb"] * 2**20)
+    logger.info(
+        f"Co-visitation built in {stats['build_s']:.1f}s on {stats['workers']} workers: "
+        f"{stats['users_with_candidates']} users with candidates, links {stats['links_mb']}MB, "
+        f"lists {stats['lists_mb']}MB"
+    )
+    return stats
+
+
+def get_covisit_candidates(user_id: str) -> list[dict]:
+    """The user's stored co-visitation list, best first (scores 0-1)."""
+    r = get_binary_redis()
+    build = r.get(CURRENT_KEY)
+    if not build:
+        return []
+    raw = r.get(f"{PREFIX}{build.decode()}:{user_id}")
+    return decode_ranked(raw) if raw else []
+
+
+def _min_max(scores: dict[str, float]) -> dict[str, float]:
+    """Scale one source's scores to 0-1 over its own candidates (all 1 when they tie)."""
+    low, high = min(scores.values()), max(scores.values())
+    span = high - low
+    return {uid: (score - low) / span if span > 0 else 1.0 for uid, score in scores.items()}
+
+
+def blend_candidates(
+    vector_recs: list[dict],
+    covisit_recs: list[dict],
+    weight: float,
+    limit: int,
+) -> list[dict]:
+    """
+    Merge the two sources as (1 - weight) * vector + weight * co-visitation,
+    each min-max scaled over its own candidates first: vector scores sit in a
+    narrow (similarity + 1) / 2 band, so on raw scales a small weight would
+    already let co-visitation outrank the best vector hits. A candidate
+    missing from a source scores 0 there. The blend (0-1) is mapped back
+    onto the vector list's own score range, so returned scores stay on the
+    raw vector scale.
+    """
+    if not vector_recs or not covisit_recs or weight <= 0:
+        return vector_recs[:limit]
+    vector = {rec["user_id"]: rec["score"] for rec in vector_recs}
+    covisit = {rec["user_id"]: rec["score"] for rec in covisit_recs}
+    vector_scaled, covisit_scaled = _min_max(vector), _min_max(covisit)
+    blended = {
+        uid: (1 - weight) * vector_scaled.get(uid, 0.0) + weight * covisit_scaled.get(uid, 0.0)
+        for uid in vector.keys() | covisit.keys()
+    }
+    low, high = min(vector.values()), max(vector.values())
+    top = heapq.nlargest(limit, blended.items(), key=lambda item: item[1])
+    return [{"user_id": uid, "score": round(low + score * (high - low), 4)} for uid, score in top]
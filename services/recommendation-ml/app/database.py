@@ -1,4 +1,7 @@
 import logging
+import math
+import re
+import time
 from contextlib import contextmanager
 
 import psycopg2
@@ -11,6 +14,16 @@ logger = logging.getLogger(__name__)
 
 _vector_extension_ready = False
 
+# SVD components: the latent head of each embedding, and the width of
+# latent_factors (raw U·Σ rows) and target_factors (V rows)
+LATENT_DIM = 64
+
+# embedding_storage → (column type, IVFFlat operator class)
+STORAGE_TYPES = {
+    "vector": ("vector", "vector_cosine_ops"),
+    "halfvec": ("halfvec", "halfvec_cosine_ops"),
+}
+
 
 def _ensure_vector_extension():
     """Create pgvector extension if it doesn't exist (raw connection, no register_vector)."""
@@ -27,10 +40,10 @@ def _ensure_vector_extension():
         conn.close()
 
 
-def get_connection():
-    """Get a database connection with pgvector support."""
+def get_connection(**connect_kwargs):
+    """Get a database connection with pgvector support (extra libpq options as kwargs)."""
     _ensure_vector_extension()
-    conn = psycopg2.connect(settings.database_url)
+    conn = psycopg2.connect(settings.database_url, **connect_kwargs)
     register_vector(conn)
     return conn
 
@@ -50,31 +63,239 @@ def get_cursor():
         conn.close()
 
 
+def embedding_storage() -> tuple[str, str]:
+    """(column type, operator class) for settings.embedding_storage."""
+    try:
+        return STORAGE_TYPES[settings.embedding_storage]
+    except KeyError:
+        raise ValueError(
+            f"Unknown embedding_storage {settings.embedding_storage!r} "
+            f"(expected one of {', '.join(STORAGE_TYPES)})"
+        ) from None
+
+
 def init_schema():
     """Initialize pgvector extension and user_embeddings table."""
     dim = settings.embedding_dimensions
+    column_type, _ = embedding_storage()
     with get_cursor() as cur:
         cur.execute(f"""
             CREATE TABLE IF NOT EXISTS user_embeddings (
                 user_id UUID PRIMARY KEY,
-                embedding vector({dim}),
+                embedding {column_type}({dim}),
                 model_version VARCHAR(20) DEFAULT 'v1.0',
-                updated_at TIMESTAMP DEFAULT now()
+                updated_at TIMESTAMP DEFAULT now(),
+                segment VARCHAR(32),
+                target_factors {column_type}({LATENT_DIM}),
+                latent_factors {column_type}({LATENT_DIM})
             )
         """)
+        cur.execute("ALTER TABLE user_embeddings ADD COLUMN IF NOT EXISTS segment VARCHAR(32)")
+        # Follow the table's current storage; switching it is an explicit step
+        # (convert_storage), never done at boot, so replicas can't race or flip it back
+        storage = _current_storage(cur)
+        cur.execute(f"ALTER TABLE user_embeddings ADD COLUMN IF NOT EXISTS target_factors {storage}({LATENT_DIM})")
+        cur.execute(f"ALTER TABLE user_embeddings ADD COLUMN IF NOT EXISTS latent_factors {storage}({LATENT_DIM})")
+        if storage != column_type:
+            logger.warning(
+                f"user_embeddings is stored as {storage} but EMBEDDING_STORAGE={settings.embedding_storage}; "
+                f"run POST /admin/embedding-storage to convert"
+            )
         # IVFFlat index requires data — only create if table has rows
         cur.execute("SELECT COUNT(*) as cnt FROM user_embeddings")
         row_count = cur.fetchone()["cnt"]
         if row_count > 0:
-            cur.execute(f"""
-                CREATE INDEX IF NOT EXISTS idx_embedding_vector
-                ON user_embeddings
-                USING ivfflat (embedding vector_cosine_ops)
-                WITH (lists = 100)
-            """)
+            # Rows written before segments existed: fill them in before indexing
+            cur.execute("SAVEPOINT sp_segments")
+            try:
+                sync_segments(cur, only_missing=True)
+            except Exception as e:
+                logger.warning(f"Segment backfill failed (users table may not exist): {e}")
+                cur.execute("ROLLBACK TO SAVEPOINT sp_segments")
+            ensure_vector_indexes(cur)
         else:
             logger.info("Skipping IVFFlat index creation (table is empty, will create after training)")
-    logger.info("Database schema initialized (pgvector + user_embeddings)")
+
+        # Single-row model state shared by all replicas
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS ml_model_state (
+                id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                generation BIGINT NOT NULL DEFAULT 0,
+                lease_holder VARCHAR(255),
+                lease_acquired_at TIMESTAMP,
+                trained_by VARCHAR(255),
+                trained_at TIMESTAMP
+            )
+        """)
+        cur.execute("INSERT INTO ml_model_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
+    logger.info("Database schema initialized (pgvector + user_embeddings + ml_model_state)")
+
+
+def _current_storage(cur) -> str:
+    """Base type of the embedding column as it exists ("vector" or "halfvec")."""
+    cur.execute("""
+        SELECT t.typname
+        FROM pg_attribute a
+        JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = 'user_embeddings'::regclass AND a.attname = 'embedding'
+    """)
+    return cur.fetchone()["typname"]
+
+
+def _convert_column(cur, column: str, target: str) -> str | None:
+    """
+    Change a vector column to `target` (e.g. halfvec(128)) if it differs.
+    The IVFFlat indexes are tied to the old operator class, so they are
+    dropped first and rebuilt by ensure_vector_indexes. Returns the old type
+    when converted.
+    """
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod) AS column_type
+        FROM pg_attribute
+        WHERE attrelid = 'user_embeddings'::regclass AND attname = %s
+    """, (column,))
+    current = cur.fetchone()["column_type"]
+    if current == target:
+        return None
+    logger.info(f"Converting user_embeddings.{column} from {current} to {target}")
+    if column == "embedding":
+        cur.execute("""
+            SELECT indexname FROM pg_indexes
+            WHERE tablename = 'user_embeddings' AND indexname LIKE 'idx_embedding_vector%'
+        """)
+        for row in cur.fetchall():
+            cur.execute(f'DROP INDEX IF EXISTS "{row["indexname"]}"')
+    cur.execute(f"ALTER TABLE user_embeddings ALTER COLUMN {column} TYPE {target} USING {column}::{target}")
+    return current
+
+
+def convert_storage() -> dict:
+    """
+    Convert the embedding columns to settings.embedding_storage and rebuild
+    the IVFFlat indexes, in one transaction. Takes ACCESS EXCLUSIVE on
+    user_embeddings for the rewrite; callers hold the training lease.
+    Returns {column: {"from": old type, "to": new type}} for converted columns.
+    """
+    column_type, _ = embedding_storage()
+    targets = {
+        "embedding": f"{column_type}({settings.embedding_dimensions})",
+        "target_factors": f"{column_type}({LATENT_DIM})",
+        "latent_factors": f"{column_type}({LATENT_DIM})",
+    }
+    converted = {}
+    with get_cursor() as cur:
+        for column, target in targets.items():
+            previous = _convert_column(cur, column, target)
+            if previous is not None:
+                converted[column] = {"from": previous, "to": target}
+        if converted:
+            cur.execute("SELECT 1 FROM user_embeddings LIMIT 1")
+            if cur.fetchone() is not None:
+                ensure_vector_indexes(cur)
+    return converted
+
+
+def index_segments() -> list[str]:
+    """Segments that get their own partial IVFFlat index (every segment named in the map)."""
+    segments = set(settings.segment_compatibility)
+    for targets in settings.segment_compatibility.values():
+        segments.update(targets)
+    # Segment names end up in index names
+    return sorted(s for s in segments if re.fullmatch(r"[a-z0-9_]{1,40}", s))
+
+
+def sync_segments(cur, user_ids: list[str] | None = None, only_missing: bool = False):
+    """Copy users."userType" onto their embeddings (all, the given users, or rows without one)."""
+    query = """
+        UPDATE user_embeddings e
+        SET segment = u."userType"::text
+        FROM users u
+        WHERE u.id = e.user_id
+          AND e.segment IS DISTINCT FROM u."userType"::text
+    """
+    params: tuple = ()
+    if user_ids is not None:
+        query += " AND e.user_id = ANY(%s::uuid[])"
+        params = (user_ids,)
+    if only_missing:
+        query += " AND e.segment IS NULL"
+    cur.execute(query, params)
+
+
+def ivf_lists(rows: int) -> int:
+    """IVFFlat list count for an index over `rows` rows (pgvector guidance: rows/1000, sqrt above 1M)."""
+    if rows > 1_000_000:
+        return int(math.sqrt(rows))
+    return max(1, rows // 1000)
+
+
+def _index_geometry(cur) -> dict[str | None, tuple[float, int]]:
+    """(indexed rows, lists) per IVFFlat index, keyed by segment (None = the global index)."""
+    cur.execute("""
+        SELECT c.relname, c.reltuples, c.reloptions
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'user_embeddings'::regclass
+          AND c.relname LIKE 'idx_embedding_vector%'
+    """)
+    geometry = {}
+    for row in cur.fetchall():
+        options = dict(opt.split("=", 1) for opt in row["reloptions"] or [])
+        segment = row["relname"][len("idx_embedding_vector_"):] or None
+        geometry[segment] = (float(row["reltuples"]), int(options.get("lists", 100)))
+    return geometry
+
+
+_geometry: dict[str | None, tuple[float, int]] = {}
+_geometry_read_at = 0.0
+
+
+def ivf_geometry() -> dict[str | None, tuple[float, int]]:
+    """Cached _index_geometry, re-read every `ivfflat_geometry_refresh` seconds."""
+    global _geometry, _geometry_read_at
+    if time.monotonic() - _geometry_read_at >= settings.ivfflat_geometry_refresh:
+        with get_cursor() as cur:
+            _geometry = _index_geometry(cur)
+        _geometry_read_at = time.monotonic()
+    return _geometry
+
+
+def ensure_vector_indexes(cur, resize: bool = False):
+    """
+    IVFFlat over all embeddings (used when a segment has no compatibility
+    entry) plus one partial index per segment, so segment-filtered k-NN only
+    visits that segment's lists. IVFFlat centroids come from the rows present
+    at build time, so segment indexes are only created once they have rows,
+    sized by ivf_lists(). With `resize` (training, under the lease) an index
+    whose list count drifted more than 2x from its row count is rebuilt.
+    """
+    _, opclass = STORAGE_TYPES[_current_storage(cur)]
+    cur.execute("SELECT segment, COUNT(*) AS cnt FROM user_embeddings GROUP BY segment")
+    counts = {row["segment"]: row["cnt"] for row in cur.fetchall()}
+    existing = _index_geometry(cur)
+
+    targets: dict[str | None, int] = {None: sum(counts.values())}
+    for segment in index_segments():
+        if counts.get(segment):
+            targets[segment] = counts[segment]
+
+    for segment, rows in targets.items():
+        name = f"idx_embedding_vector_{segment}" if segment else "idx_embedding_vector"
+        lists = ivf_lists(rows)
+        if segment in existing:
+            current = existing[segment][1]
+            if not resize or (lists <= 2 * current and current <= 2 * lists):
+                continue
+            logger.info(f"Rebuilding {name}: {rows} rows, lists {current} -> {lists}")
+            cur.execute(f'DROP INDEX IF EXISTS "{name}"')
+        where = "WHERE segment = %s" if segment else ""
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {name}
+            ON user_embeddings
+            USING ivfflat (embedding {opclass})
+            WITH (lists = {lists})
+            {where}
+        """, (segment,) if segment else None)
 
 
 def get_embedding_count() -> int:
@@ -91,3 +312,11 @@ def get_last_update():
         cur.execute("SELECT MAX(updated_at) as last FROM user_embeddings")
         row = cur.fetchone()
         return row["last"] if row else None
+
+
+def get_model_state() -> dict:
+    """Get the shared model state row (generation, lease, last training)."""
+    with get_cursor() as cur:
+        cur.execute("SELECT * FROM ml_model_state WHERE id = 1")
+        row = cur.fetchone()
+        return dict(row) if row else {"generation": 0}
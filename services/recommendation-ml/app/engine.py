@@ -1,13 +1,26 @@
 import logging
+import math
 import time
+import zlib
 from datetime import datetime, timedelta, timezone
+from typing import Iterable
 
 import numpy as np
+import psycopg2.extras
 from scipy.sparse import csr_matrix
 from sklearn.decomposition import TruncatedSVD
 
 from .config import settings
-from .database import get_cursor
+from .covisitation import rebuild_covisitation
+from .database import LATENT_DIM, ensure_vector_indexes, get_cursor, ivf_geometry, sync_segments
+from .metrics import (
+    KNN_QUERY_SECONDS,
+    TRAINING_MATRIX_NNZ,
+    TRAINING_STAGE_SECONDS,
+    TRAINING_USERS,
+)
+from .profiling import stage
+from .recall_monitor import maybe_sample
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +40,6 @@ SIGNAL_WEIGHTS = {
 }
 
 DIM = settings.embedding_dimensions
-LATENT_DIM = 64  # latent dimensions from matrix factorization
 
 
 def _build_interaction_matrix() -> tuple[csr_matrix, list[str], list[str]]:
@@ -61,6 +73,14 @@ def _build_interaction_matrix() -> tuple[csr_matrix, list[str], list[str]]:
             logger.warning(f"user_behavior_events query failed (table may not exist): {e}")
             cur.execute("ROLLBACK TO SAVEPOINT sp_behavior")
 
+    return _matrix_from_rows(swipe_rows, behavior_rows)
+
+
+def _matrix_from_rows(
+    swipe_rows: Iterable[dict],
+    behavior_rows: Iterable[dict],
+) -> tuple[csr_matrix, list[str], list[str]]:
+    """Turn swipe + behavior rows into the weighted user-user matrix (no I/O)."""
     # Collect all unique user IDs
     user_set = set()
     interactions: list[tuple[str, str, float]] = []
@@ -109,33 +129,53 @@ def _build_user_features(user_ids: list[str]) -> dict[str, np.ndarray]:
     Combines demographic (8d) + tag (40d) + engagement (20d) = 68d explicit features.
     The remaining dimensions come from collaborative filtering latent factors.
     """
-    explicit_dim = DIM - LATENT_DIM  # 64 explicit features
-    features = {}
-
     with get_cursor() as cur:
-        # Batch fetch user demographics
+        user_rows, tag_rows = _fetch_feature_rows(cur, user_ids)
+    return _features_from_rows(user_ids, user_rows, tag_rows)
+
+
+def _fetch_feature_rows(cur, user_ids: list[str]) -> tuple[dict[str, dict], list[dict]]:
+    """Demographic rows (by user id) and tag rows for the given users."""
+    # Batch fetch user demographics
+    cur.execute("""
+        SELECT id, "userType", "birthDate",
+               "verificationStatus", "createdAt"
+        FROM users
+        WHERE id = ANY(%s::uuid[])
+    """, (user_ids,))
+    user_rows = {str(r["id"]): r for r in cur.fetchall()}
+
+    # Batch fetch user tags — graceful fallback if tables missing
+    tag_rows = []
+    try:
+        cur.execute("SAVEPOINT sp_tags")
         cur.execute("""
-            SELECT id, "userType", "birthDate",
-                   "verificationStatus", "createdAt"
-            FROM users
-            WHERE id = ANY(%s::uuid[])
+            SELECT uit."userId", it.category, it.name, it.id as tag_id
+            FROM user_interest_tags uit
+            JOIN interest_tags it ON uit."tagId" = it.id
+            WHERE uit."userId" = ANY(%s::uuid[])
         """, (user_ids,))
-        user_rows = {str(r["id"]): r for r in cur.fetchall()}
+        tag_rows = cur.fetchall()
+    except Exception as e:
+        logger.warning(f"user_interest_tags query failed (table may not exist): {e}")
+        cur.execute("ROLLBACK TO SAVEPOINT sp_tags")
 
-        # Batch fetch user tags — graceful fallback if tables missing
-        tag_rows = []
-        try:
-            cur.execute("SAVEPOINT sp_tags")
-            cur.execute("""
-                SELECT uit."userId", it.category, it.name, it.id as tag_id
-                FROM user_interest_tags uit
-                JOIN interest_tags it ON uit."tagId" = it.id
-                WHERE uit."userId" = ANY(%s::uuid[])
-            """, (user_ids,))
-            tag_rows = cur.fetchall()
-        except Exception as e:
-            logger.warning(f"user_interest_tags query failed (table may not exist): {e}")
-            cur.execute("ROLLBACK TO SAVEPOINT sp_tags")
+    return user_rows, tag_rows
+
+
+def _tag_slot(name: str) -> int:
+    """Stable slot for a tag within its category (same on every replica/process)."""
+    return zlib.crc32(name.encode("utf-8")) % 10
+
+
+def _features_from_rows(
+    user_ids: list[str],
+    user_rows: dict[str, dict],
+    tag_rows: Iterable[dict],
+) -> dict[str, np.ndarray]:
+    """Encode fetched demographic + tag rows into explicit feature vectors (no I/O)."""
+    explicit_dim = DIM - LATENT_DIM  # 64 explicit features
+    features = {}
 
     # Group tags by user
     user_tags: dict[str, list[dict]] = {}
@@ -179,7 +219,7 @@ def _build_user_features(user_ids: list[str]) -> dict[str, np.ndarray]:
             ci = cat_idx.get(tag["category"], 0)
             base = 8 + ci * 10
             # Hash tag name to a slot within the category's 10 dimensions
-            slot = hash(tag["name"]) % 10
+            slot = _tag_slot(tag["name"])
             vec[base + slot] = 1.0
 
         # Engagement features (48-63): 16 dimensions
@@ -192,47 +232,42 @@ def _build_user_features(user_ids: list[str]) -> dict[str, np.ndarray]:
     return features
 
 
-def train_embeddings() -> tuple[int, float]:
+def _factorize(matrix: csr_matrix) -> tuple[np.ndarray, np.ndarray] | None:
     """
-    Train user embeddings using matrix factorization + explicit features.
-    Returns (updated_count, duration_seconds).
+    Truncated SVD of the interaction matrix M ≈ U·Σ·Vᵀ (rows = who acted,
+    columns = who was acted on). Returns (U·Σ, V), both (n_users,
+    LATENT_DIM): latent factors for the embedding, and target factors so that
+    latent[a] · target[b] predicts a's interest in b.
+    Returns None when the matrix is too small to decompose.
     """
-    start = time.time()
-    logger.info("Starting embedding training...")
-
-    # Step 1: Build interaction matrix
-    matrix, row_users, col_users = _build_interaction_matrix()
-    n_users = len(row_users)
-
-    if n_users < settings.min_interactions_for_training:
-        logger.warning(f"Not enough users for training: {n_users}")
-        return 0, time.time() - start
-
-    logger.info(f"Interaction matrix: {matrix.shape}, nnz={matrix.nnz}")
-
-    # Step 2: Matrix factorization → latent factors
+    n_users = matrix.shape[0]
     n_components = min(LATENT_DIM, n_users - 1, matrix.shape[1] - 1)
     if n_components < 2:
-        logger.warning("Not enough data for SVD decomposition")
-        return 0, time.time() - start
+        return None
 
     svd = TruncatedSVD(n_components=n_components, random_state=42)
     latent_factors = svd.fit_transform(matrix)  # shape: (n_users, n_components)
+    target_factors = svd.components_.T.astype(np.float32)  # shape: (n_cols, n_components)
 
     # Pad to LATENT_DIM if n_components < LATENT_DIM
     if n_components < LATENT_DIM:
         padding = np.zeros((n_users, LATENT_DIM - n_components), dtype=np.float32)
         latent_factors = np.hstack([latent_factors, padding])
+        target_factors = np.hstack([target_factors, padding[:target_factors.shape[0]]])
 
     logger.info(f"SVD explained variance ratio sum: {svd.explained_variance_ratio_.sum():.3f}")
+    return latent_factors, target_factors
 
-    # Step 3: Build explicit features
-    explicit_features = _build_user_features(row_users)
 
-    # Step 4: Concatenate latent + explicit → 128d embedding
+def _combine_embeddings(
+    user_ids: list[str],
+    latent_factors: np.ndarray,
+    explicit_features: dict[str, np.ndarray],
+) -> dict[str, np.ndarray]:
+    """Concatenate latent + explicit parts and L2-normalize for cosine similarity."""
     embeddings = {}
     explicit_dim = DIM - LATENT_DIM
-    for i, uid in enumerate(row_users):
+    for i, uid in enumerate(user_ids):
         latent = latent_factors[i].astype(np.float32)
         explicit = explicit_features.get(uid, np.zeros(explicit_dim, dtype=np.float32))
         combined = np.concatenate([latent, explicit])
@@ -241,32 +276,155 @@ def train_embeddings() -> tuple[int, float]:
         if norm > 0:
             combined = combined / norm
         embeddings[uid] = combined
+    return embeddings
+
+
+def train_embeddings() -> tuple[int, float]:
+    """
+    Train user embeddings using matrix factorization + explicit features.
+    Returns (updated_count, duration_seconds).
+    """
+    start = time.time()
+    logger.info("Starting embedding training...")
+
+    # Step 1: Build interaction matrix
+    with TRAINING_STAGE_SECONDS.labels("matrix_build").time():
+        matrix, row_users, col_users = _build_interaction_matrix()
+    n_users = len(row_users)
+    TRAINING_MATRIX_NNZ.set(matrix.nnz)
+
+    if n_users < settings.min_interactions_for_training:
+        logger.warning(f"Not enough users for training: {n_users}")
+        return 0, time.time() - start
+
+    logger.info(f"Interaction matrix: {matrix.shape}, nnz={matrix.nnz}")
+
+    # Step 2: Matrix factorization → latent factors
+    with TRAINING_STAGE_SECONDS.labels("svd").time():
+        factors = _factorize(matrix)
+    if factors is None:
+        logger.warning("Not enough data for SVD decomposition")
+        return 0, time.time() - start
+    latent_factors, target_factors = factors
+
+    # Step 3: Build explicit features
+    with TRAINING_STAGE_SECONDS.labels("feature_build").time():
+        explicit_features = _build_user_features(row_users)
+
+    # Step 4: Concatenate latent + explicit → 128d embedding
+    embeddings = _combine_embeddings(row_users, latent_factors, explicit_features)
 
     # Step 5: Upsert embeddings to PostgreSQL
     with get_cursor() as cur:
-        for uid, emb in embeddings.items():
-            cur.execute("""
-                INSERT INTO user_embeddings (user_id, embedding, model_version, updated_at)
-                VALUES (%s, %s, %s, now())
-                ON CONFLICT (user_id)
-                DO UPDATE SET embedding = EXCLUDED.embedding,
-                             model_version = EXCLUDED.model_version,
-                             updated_at = now()
-            """, (uid, emb.tolist(), MODEL_VERSION))
-
-        # Ensure IVFFlat index exists now that we have data
-        cur.execute("""
-            CREATE INDEX IF NOT EXISTS idx_embedding_vector
-            ON user_embeddings
-            USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = 100)
-        """)
+        with TRAINING_STAGE_SECONDS.labels("write").time():
+            # embeddings and both factor matrices are in row_users order. The raw
+            # U·Σ rows are kept apart from the normalized embedding: affinities
+            # and incremental updates need them unscaled
+            for i, (uid, emb) in enumerate(embeddings.items()):
+                cur.execute("""
+                    INSERT INTO user_embeddings
+                        (user_id, embedding, latent_factors, target_factors, model_version, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, now())
+                    ON CONFLICT (user_id)
+                    DO UPDATE SET embedding = EXCLUDED.embedding,
+                                 latent_factors = EXCLUDED.latent_factors,
+                                 target_factors = EXCLUDED.target_factors,
+                                 model_version = EXCLUDED.model_version,
+                                 updated_at = now()
+                """, (uid, emb.tolist(), latent_factors[i].tolist(), target_factors[i].tolist(), MODEL_VERSION))
+
+        # Segments first: the per-segment partial indexes filter on them
+        with TRAINING_STAGE_SECONDS.labels("index").time():
+            sync_segments(cur)
+            ensure_vector_indexes(cur, resize=True)
+
+    # Step 6: Co-visitation candidates (reads the segments synced above)
+    if settings.covisit_blend > 0:
+        try:
+            with TRAINING_STAGE_SECONDS.labels("covisitation").time():
+                rebuild_covisitation(matrix, row_users)
+        except Exception as e:
+            logger.error(f"Co-visitation build failed: {e}")
 
+    TRAINING_USERS.set(len(embeddings))
     duration = time.time() - start
     logger.info(f"Training complete: {len(embeddings)} embeddings in {duration:.1f}s")
     return len(embeddings), duration
 
 
+def compatible_segments(segment: str | None) -> list[str] | None:
+    """Segments a user may be matched with; None = no partitioning (search everything)."""
+    if segment is None:
+        return None
+    return settings.segment_compatibility.get(segment)
+
+
+# Per-candidate forward (viewer → candidate) and reverse (candidate → viewer)
+# predicted interest (U·Σ)_a · V_b, from the raw factor columns, computed only
+# for the rows the k-NN returns. Params: viewer latent factors, viewer target
+# factors. <#> is -inner product.
+RECIPROCAL_COLUMNS = """,
+               -COALESCE(target_factors <#> %s, 0) as forward,
+               -COALESCE(latent_factors <#> %s, 0) as reverse"""
+
+
+def ivfflat_probes(segments: list[str] | None, depth: int) -> int:
+    """
+    Probes for a k-NN of `depth` rows: enough lists to hold
+    `ivfflat_probe_margin` x depth rows in the searched index (the largest
+    need across segments, since SET LOCAL covers every branch), at least
+    `ivfflat_probes` and at most the index's list count. A 500-deep ranked
+    list on a one-probe index would otherwise stop at a single list.
+    """
+    probes = settings.ivfflat_probes or 1
+    if settings.ivfflat_probe_margin <= 0:
+        return probes
+    geometry = ivf_geometry()
+    for segment in segments or [None]:
+        rows, lists = geometry.get(segment, (0.0, 0))
+        if rows > 0 and lists > 0:
+            needed = math.ceil(settings.ivfflat_probe_margin * depth * lists / rows)
+            probes = max(probes, min(lists, needed))
+    return probes
+
+
+def _segment_knn_sql(segment_count: int, columns: str = "") -> str:
+    # One branch per segment, each `segment = <literal>` so the planner picks
+    # that segment's partial IVFFlat index; branches are merged by similarity
+    branch = f"""(
+        SELECT user_id,
+               1 - (embedding <=> %s) as similarity{columns}
+        FROM user_embeddings
+        WHERE segment = %s
+          AND user_id != %s
+          AND user_id != ALL(%s::uuid[])
+        ORDER BY embedding <=> %s
+        LIMIT %s
+    )"""
+    return "\nUNION ALL\n".join([branch] * segment_count) + "\nORDER BY similarity DESC\nLIMIT %s"
+
+
+def reciprocal_scores(
+    scores: np.ndarray,
+    forward: np.ndarray,
+    reverse: np.ndarray,
+    weight: float,
+) -> np.ndarray:
+    """
+    Blend one-way scores (0-1) with mutual interest for one candidate set
+    (no I/O). Forward and reverse affinity are min-max scaled over the set
+    and combined by harmonic mean, so only candidates whose interest runs
+    both ways score high on that part.
+    """
+    def scaled(values: np.ndarray) -> np.ndarray:
+        span = np.ptp(values)
+        return (values - values.min()) / span if span > 0 else np.ones_like(values)
+
+    f, r = scaled(forward), scaled(reverse)
+    mutual = 2 * f * r / np.maximum(f + r, 1e-9)
+    return (1 - weight) * scores + weight * mutual
+
+
 def get_recommendations(
     user_id: str,
     limit: int = 50,
@@ -274,104 +432,169 @@ def get_recommendations(
 ) -> list[dict]:
     """
     Get top-N recommendations using pgvector cosine similarity.
+    Only segments compatible with the user's own (settings.segment_compatibility)
+    are searched, so every returned candidate counts toward `limit`.
+    With `reciprocal_blend` set, `reciprocal_overfetch` times as many
+    candidates are fetched and re-ranked by two-way interest.
     Returns list of {user_id, score}.
     """
     exclude_ids = exclude_ids or []
 
     with get_cursor() as cur:
         # Get user's embedding
-        cur.execute(
-            "SELECT embedding FROM user_embeddings WHERE user_id = %s",
-            (user_id,),
-        )
-        row = cur.fetchone()
+        with stage("embedding_fetch"):
+            cur.execute(
+                "SELECT embedding, segment, latent_factors, target_factors FROM user_embeddings WHERE user_id = %s",
+                (user_id,),
+            )
+            row = cur.fetchone()
         if not row:
             logger.debug(f"No embedding found for user {user_id}")
             return []
 
         user_embedding = row["embedding"]
+        segments = compatible_segments(row["segment"])
+        if segments == []:
+            return []  # segment configured to match nobody
+
+        # Users embedded since the last training have no target factors yet
+        rerank = (
+            settings.reciprocal_blend > 0
+            and row["latent_factors"] is not None
+            and row["target_factors"] is not None
+        )
+        columns, extra, knn_limit = "", [], limit
+        if rerank:
+            columns = RECIPROCAL_COLUMNS
+            extra = [row["latent_factors"], row["target_factors"]]
+            knn_limit = limit * max(1, settings.reciprocal_overfetch)
 
         # k-NN search using pgvector cosine distance
         # 1 - cosine_distance = cosine_similarity
         # Fetch more than limit to account for excludes
-        fetch_limit = limit + len(exclude_ids) + 20
+        fetch_limit = knn_limit + len(exclude_ids) + 20
+
+        probes = ivfflat_probes(segments, fetch_limit if exclude_ids else knn_limit)
+        if probes > 1:
+            cur.execute("SET LOCAL ivfflat.probes = %s", (probes,))
+
+        knn_start = time.perf_counter()
+        with stage("knn"), KNN_QUERY_SECONDS.time():
+            if segments:
+                branch_limit = fetch_limit if exclude_ids else knn_limit
+                params = []
+                for segment in segments:
+                    params += [user_embedding, *extra, segment, user_id, exclude_ids, user_embedding, branch_limit]
+                cur.execute(_segment_knn_sql(len(segments), columns), (*params, branch_limit))
+            elif exclude_ids:
+                cur.execute(f"""
+                    SELECT user_id,
+                           1 - (embedding <=> %s) as similarity{columns}
+                    FROM user_embeddings
+                    WHERE user_id != %s
+                      AND user_id != ALL(%s)
+                    ORDER BY embedding <=> %s
+                    LIMIT %s
+                """, (user_embedding, *extra, user_id, exclude_ids, user_embedding, fetch_limit))
+            else:
+                cur.execute(f"""
+                    SELECT user_id,
+                           1 - (embedding <=> %s) as similarity{columns}
+                    FROM user_embeddings
+                    WHERE user_id != %s
+                    ORDER BY embedding <=> %s
+                    LIMIT %s
+                """, (user_embedding, *extra, user_id, user_embedding, knn_limit))
+
+            results = cur.fetchall()
+        knn_seconds = time.perf_counter() - knn_start
+
+    maybe_sample(
+        user_id,
+        user_embedding,
+        exclude_ids,
+        results[:limit],
+        knn_seconds,
+        limit,
+        segments,
+        probes,
+    )
 
-        if exclude_ids:
-            cur.execute("""
-                SELECT user_id,
-                       1 - (embedding <=> %s) as similarity
-                FROM user_embeddings
-                WHERE user_id != %s
-                  AND user_id != ALL(%s)
-                ORDER BY embedding <=> %s
-                LIMIT %s
-            """, (user_embedding, user_id, exclude_ids, user_embedding, fetch_limit))
-        else:
-            cur.execute("""
-                SELECT user_id,
-                       1 - (embedding <=> %s) as similarity
-                FROM user_embeddings
-                WHERE user_id != %s
-                ORDER BY embedding <=> %s
-                LIMIT %s
-            """, (user_embedding, user_id, user_embedding, limit))
+    # Normalize scores to 0-1 range
+    scores = np.clip((np.array([r["similarity"] for r in results], dtype=np.float32) + 1) / 2, 0.0, 1.0)
+    if rerank and results:
+        with stage("rerank"):
+            forward = np.array([r["forward"] for r in results], dtype=np.float32)
+            reverse = np.array([r["reverse"] for r in results], dtype=np.float32)
+            scores = reciprocal_scores(scores, forward, reverse, settings.reciprocal_blend)
+    order = np.argsort(-scores, kind="stable")[:limit]
 
-        results = cur.fetchall()
+    return [
+        {"user_id": str(results[i]["user_id"]), "score": round(float(scores[i]), 4)}
+        for i in order
+    ]
 
-    # Normalize scores to 0-1 range
-    recs = []
-    for row in results[:limit]:
-        score = max(0.0, min(1.0, (row["similarity"] + 1) / 2))
-        recs.append({
-            "user_id": str(row["user_id"]),
-            "score": round(score, 4),
-        })
 
-    return recs
+def _as_array(embedding) -> np.ndarray:
+    # halfvec columns come back as pgvector HalfVector, vector columns as ndarray
+    if hasattr(embedding, "to_numpy"):
+        embedding = embedding.to_numpy()
+    return np.asarray(embedding, dtype=np.float32)
 
 
-def update_single_embedding(user_id: str) -> bool:
+def update_embeddings(user_ids: list[str]) -> list[str]:
     """
-    Update embedding for a single user (incremental).
-    Uses existing model — just recomputes their explicit features
-    and stores with latest latent factors if available.
+    Incrementally update a chunk of users' embeddings on one connection:
+    recompute their explicit features and combine them with each user's
+    stored raw latent factors (zeros for users without any), then upsert the
+    chunk in one statement.
+    Returns the ids that were updated (users without a users row are skipped).
     """
-    features = _build_user_features([user_id])
-    if user_id not in features:
-        return False
-
-    explicit = features[user_id]
-    explicit_dim = DIM - LATENT_DIM
-
-    # Check if user has existing embedding (use latent part)
     with get_cursor() as cur:
-        cur.execute(
-            "SELECT embedding FROM user_embeddings WHERE user_id = %s",
-            (user_id,),
-        )
-        row = cur.fetchone()
-
-    if row:
-        # Keep existing latent part, update explicit part
-        old_emb = np.array(row["embedding"], dtype=np.float32)
-        latent = old_emb[:LATENT_DIM]
-        combined = np.concatenate([latent, explicit])
-    else:
-        # No latent factors yet — use zeros + explicit features
-        latent = np.zeros(LATENT_DIM, dtype=np.float32)
-        combined = np.concatenate([latent, explicit])
-
-    # L2 normalize
-    norm = np.linalg.norm(combined)
-    if norm > 0:
-        combined = combined / norm
+        user_rows, tag_rows = _fetch_feature_rows(cur, user_ids)
+        found = [uid for uid in dict.fromkeys(user_ids) if uid in user_rows]
+        if not found:
+            return []
+        features = _features_from_rows(found, user_rows, tag_rows)
 
-    with get_cursor() as cur:
         cur.execute("""
+            SELECT user_id::text AS user_id, embedding, latent_factors
+            FROM user_embeddings
+            WHERE user_id = ANY(%s::uuid[])
+        """, (found,))
+        # Rows trained before latent_factors existed fall back to the embedding
+        # head until the next training run
+        stored = {
+            row["user_id"]: _as_array(
+                row["latent_factors"] if row["latent_factors"] is not None else _as_array(row["embedding"])[:LATENT_DIM]
+            )
+            for row in cur.fetchall()
+        }
+
+        # Raw U·Σ + fresh explicit part, normalized together exactly as in
+        # training (the embedding's own head is already scaled by the old norm)
+        latent = np.zeros((len(found), LATENT_DIM), dtype=np.float32)
+        for i, uid in enumerate(found):
+            if uid in stored:
+                latent[i] = stored[uid]
+        combined = np.hstack([latent, np.stack([features[uid] for uid in found])])
+        norms = np.linalg.norm(combined, axis=1, keepdims=True)
+        combined = combined / np.where(norms > 0, norms, 1.0)
+
+        psycopg2.extras.execute_values(cur, """
             INSERT INTO user_embeddings (user_id, embedding, model_version, updated_at)
-            VALUES (%s, %s, %s, now())
+            VALUES %s
             ON CONFLICT (user_id)
             DO UPDATE SET embedding = EXCLUDED.embedding, updated_at = now()
-        """, (user_id, combined.tolist(), MODEL_VERSION))
+        """, [(uid, vec, MODEL_VERSION) for uid, vec in zip(found, combined)],
+            template="(%s::uuid, %s, %s, now())",
+            page_size=len(found),
+        )
+        sync_segments(cur, found)
 
-    return True
+    return found
+
+
+def update_single_embedding(user_id: str) -> bool:
+    """Update one user's embedding (incremental). False if the user doesn't exist."""
+    return bool(update_embeddings([user_id]))
@@ -0,0 +1,183 @@
+import asyncio
+import io
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# opennsfw2's YAHOO preprocessing resizes to 256x256 before the 224 crop,
+# so nothing above 256px on the short side is ever used
+DECODE_SIZE = 256
+
+_client: Optional[httpx.AsyncClient] = None
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+
+class ImageTooLarge(ValueError):
+    """Image exceeds the configured byte or pixel budget."""
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Pooled async HTTP client shared by all image fetches (keep-alive reuse)."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.image_fetch_timeout_seconds),
+            limits=httpx.Limits(
+                max_connections=settings.image_fetch_max_connections,
+                max_keepalive_connections=settings.image_fetch_max_connections,
+            ),
+            follow_redirects=True,
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@asynccontextmanager
+async def _host_slot(host: str):
+    """Cap concurrent fetches per host so one slow CDN can't take the whole pool."""
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots.setdefault(host, asyncio.Semaphore(settings.image_fetch_max_per_host))
+    async with slot:
+        yield
+
+
+async def fetch_image_bytes(url: str) -> bytes:
+    """
+    Stream an image over the pooled client, aborting as soon as it exceeds
+    `image_max_bytes` (checked against Content-Length first, then while reading).
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Unsupported image URL: {url}")
+
+    max_bytes = settings.image_max_bytes
+    async with _host_slot(parts.hostname):
+        async with get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ImageTooLarge(f"Image is {declared} bytes (max {max_bytes})")
+
+            buf = bytearray()
+            async for chunk in response.aiter_bytes():
+                buf.extend(chunk)
+                if len(buf) > max_bytes:
+                    raise ImageTooLarge(f"Image exceeds {max_bytes} bytes")
+    return bytes(buf)
+
+
+def _open_checked(image_bytes: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    if width * height > settings.image_max_pixels:
+        raise ImageTooLarge(f"Image is {width}x{height} (max {settings.image_max_pixels} pixels)")
+    return image
+
+
+def _reduce_rgb(image: Image.Image, size: int) -> Image.Image:
+    image = image.convert("RGB")
+    factor = min(image.width // size, image.height // size)
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def decode_for_model(image_bytes: bytes, size: int = DECODE_SIZE) -> Image.Image:
+    """
+    Decode straight to roughly model resolution.
+
+    JPEGs use draft mode (libjpeg DCT scaling by 1/2, 1/4 or 1/8 while
+    decoding), so a 12MP photo never materialises at full size. Other formats
+    are box-reduced right after decoding. The result is never smaller than
+    `size` on either side, so the model-side resize stays a downscale.
+    """
+    image = _open_checked(image_bytes)
+    if image.format == "JPEG":
+        image.draft("RGB", (size, size))
+    return _reduce_rgb(image, size)
+
+
+def sample_frame_indices(frame_count: int, strategy: str, max_frames: int) -> list[int]:
+    """Frame indices for the uniform (evenly spaced) and capped (first N) strategies."""
+    max_frames = max(1, max_frames)
+    if frame_count <= max_frames:
+        return list(range(frame_count))
+    if strategy == "capped":
+        return list(range(max_frames))
+    return sorted({int(i) for i in np.linspace(0, frame_count - 1, max_frames).round()})
+
+
+def _scene_change_indices(
+    image: Image.Image,
+    frame_count: int,
+    max_frames: int,
+    threshold: float,
+    scan_frames: int,
+) -> list[int]:
+    """
+    Keyframes where a 32x32 grey thumbnail differs from the previous keyframe
+    by at least `threshold`. At most `scan_frames` frames are inspected (strided
+    over long animations); if there are too many cuts the biggest ones win.
+    """
+    stride = max(1, -(-frame_count // max(1, scan_frames)))
+    keyframe, cuts = None, []
+    for index in range(0, frame_count, stride):
+        image.seek(index)
+        thumb = np.asarray(image.convert("L").resize((32, 32), Image.BILINEAR), dtype=np.float32) / 255
+        if keyframe is None:
+            keyframe = thumb
+            continue
+        change = float(np.abs(thumb - keyframe).mean())
+        if change >= threshold:
+            cuts.append((change, index))
+            keyframe = thumb
+    cuts.sort(reverse=True)
+    return sorted([0] + [index for _, index in cuts[: max(1, max_frames) - 1]])
+
+
+def decode_frames(image_bytes: bytes, size: int = DECODE_SIZE) -> tuple[list[Image.Image], int]:
+    """
+    Decode the frames of an (optionally animated) image that should be scored.
+
+    Stills go through decode_for_model. For GIF / WebP / APNG animations, frames
+    are picked by `nsfw_frame_strategy` and only those are converted and reduced;
+    the rest are at most stepped over by the decoder. Returns (frames, frame_count).
+    """
+    image = _open_checked(image_bytes)
+    frame_count = getattr(image, "n_frames", 1)
+    if frame_count <= 1:
+        return [decode_for_model(image_bytes, size)], 1
+
+    strategy = settings.nsfw_frame_strategy
+    if strategy == "scene_change":
+        indices = _scene_change_indices(
+            image,
+            frame_count,
+            settings.nsfw_max_frames,
+            settings.nsfw_scene_threshold,
+            settings.nsfw_scene_scan_frames,
+        )
+    else:
+        indices = sample_frame_indices(frame_count, strategy, settings.nsfw_max_frames)
+
+    frames = []
+    for index in indices:  # ascending, so each seek only steps forward
+        image.seek(index)
+        frames.append(_reduce_rgb(image, size))
+    return frames, frame_count
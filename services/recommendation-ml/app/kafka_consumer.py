@@ -1,12 +1,15 @@
 import json
 import logging
 import threading
+import time
 from typing import Optional
 
 from confluent_kafka import Consumer, KafkaError
 
+from .cold_start import record_swipe
 from .config import settings
 from .engine import update_single_embedding
+from .metrics import KAFKA_CONSUMER_LAG, KAFKA_MESSAGES, KAFKA_PROCESSING_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,8 @@ TOPIC_BEHAVIOR_BATCH = "behavior.batch"
 TOPIC_SWIPE = "matching.swipe"
 TOPIC_PROFILE_UPDATE = "user.profile.updated"
 
+LAG_REPORT_INTERVAL = 15.0  # seconds between watermark queries
+
 
 def _create_consumer() -> Consumer:
     return Consumer({
@@ -32,6 +37,7 @@ def _create_consumer() -> Consumer:
 
 def _process_message(topic: str, value: dict):
     """Process a single Kafka message."""
+    start = time.perf_counter()
     try:
         if topic == TOPIC_BEHAVIOR_BATCH:
             # Batch of behavior events — update embeddings for involved users
@@ -57,6 +63,7 @@ def _process_message(topic: str, value: dict):
                 update_single_embedding(swiper)
             if swiped:
                 update_single_embedding(swiped)
+                record_swipe(swiped, value.get("action"))
 
         elif topic == TOPIC_PROFILE_UPDATE:
             # Profile update — update user's explicit features
@@ -65,7 +72,24 @@ def _process_message(topic: str, value: dict):
                 update_single_embedding(uid)
 
     except Exception as e:
+        KAFKA_MESSAGES.labels(topic, "error").inc()
         logger.error(f"Error processing {topic} message: {e}")
+    else:
+        KAFKA_MESSAGES.labels(topic, "ok").inc()
+    finally:
+        KAFKA_PROCESSING_SECONDS.labels(topic).observe(time.perf_counter() - start)
+
+
+def _report_lag(consumer: Consumer):
+    """Publish per-partition consumer lag (high watermark - position)."""
+    assignment = consumer.assignment()
+    if not assignment:
+        return
+    for tp in consumer.position(assignment):
+        _, high = consumer.get_watermark_offsets(tp, timeout=1.0)
+        # Negative offset = nothing consumed yet on this partition
+        lag = high - tp.offset if tp.offset >= 0 else 0
+        KAFKA_CONSUMER_LAG.labels(tp.topic, str(tp.partition)).set(max(lag, 0))
 
 
 def _consumer_loop():
@@ -75,9 +99,14 @@ def _consumer_loop():
     topics = [TOPIC_BEHAVIOR_BATCH, TOPIC_SWIPE, TOPIC_PROFILE_UPDATE]
     consumer.subscribe(topics)
     logger.info(f"Kafka consumer subscribed to: {topics}")
+    next_lag_report = time.monotonic() + LAG_REPORT_INTERVAL
 
     while _running:
         try:
+            if time.monotonic() >= next_lag_report:
+                next_lag_report = time.monotonic() + LAG_REPORT_INTERVAL
+                _report_lag(consumer)
+
             msg = consumer.poll(timeout=1.0)
             if msg is None:
                 continue
@@ -92,6 +121,7 @@ def _consumer_loop():
             try:
                 value = json.loads(msg.value().decode("utf-8"))
             except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                KAFKA_MESSAGES.labels(topic, "invalid").inc()
                 logger.warning(f"Failed to decode message from {topic}: {e}")
                 continue
 
@@ -2,30 +2,44 @@ import logging
 from contextlib import asynccontextmanager
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 
+from .admin_router import admin_router
+from .bulk_update import get_job, start_job
+from .cold_start import get_cold_start_recommendations, reload_cold_start_lists
 from .config import settings
+from .coordination import (
+    BUSY,
+    LOST,
+    NODE_ID,
+    check_generation,
+    coordinated_train,
+    get_generation,
+    get_lease_info,
+    register_reload_hook,
+    wait_for_generation,
+)
 from .database import get_embedding_count, get_last_update, init_schema
 from .engine import (
     MODEL_VERSION,
-    get_recommendations,
-    train_embeddings,
     update_single_embedding,
 )
+from .image_ingest import close_http_client
 from .kafka_consumer import start_consumer, stop_consumer
+from .metrics import CACHE_REQUESTS, MetricsMiddleware, render_metrics
 from .models import (
     BatchUpdateResponse,
+    BulkUpdateJob,
+    BulkUpdateRequest,
     HealthResponse,
     RecommendationItem,
     RecommendResponse,
     UpdateEmbeddingRequest,
 )
 from .moderation_router import moderation_router
-from .redis_client import (
-    cache_recommendations,
-    get_cached_recommendations,
-    invalidate_all_recs,
-)
+from .nsfw_detector import ensure_inference_pool, shutdown_inference_pool
+from .profiling import request_stages, stage
+from .ranked_list import get_page, invalidate_ranked_lists
 
 logging.basicConfig(
     level=getattr(logging, settings.log_level.upper(), logging.INFO),
@@ -37,29 +51,57 @@ scheduler = BackgroundScheduler()
 
 
 def _scheduled_train():
-    """Run scheduled batch training and invalidate caches."""
+    """Run scheduled batch training if this replica wins the training lease."""
     try:
-        count, duration = train_embeddings()
-        if count > 0:
-            invalidate_all_recs()
-        logger.info(f"Scheduled training done: {count} embeddings in {duration:.1f}s")
+        status, count, duration = coordinated_train(
+            "cron",
+            expected_generation=get_generation(),
+            skip_if_trained_within=settings.cron_skip_if_trained_within_seconds,
+        )
+        if status == BUSY:
+            # The leader publishes a new generation; the generation poll reloads it
+            return
+        logger.info(f"Scheduled training {status}: {count} embeddings in {duration:.1f}s")
     except Exception as e:
         logger.error(f"Scheduled training failed: {e}")
 
 
+def _poll_generation():
+    """Pick up model generations published by other replicas."""
+    try:
+        check_generation()
+    except Exception as e:
+        logger.warning(f"Model generation poll failed: {e}")
+
+
+def _reload_cold_start():
+    """Pick up Kafka increments other replicas made to the cold-start lists."""
+    try:
+        reload_cold_start_lists()
+    except Exception as e:
+        logger.warning(f"Cold-start list reload failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     # Startup
     logger.info("Initializing recommendation-ml service...")
     init_schema()
+    register_reload_hook(reload_cold_start_lists)
 
-    # Auto-train on startup if no embeddings exist
+    # Auto-train on startup if no embeddings exist (only one replica trains)
     try:
+        generation = check_generation()
         count = get_embedding_count()
         if count == 0:
             logger.info("No embeddings found — running initial training...")
-            trained, duration = train_embeddings()
-            logger.info(f"Initial training complete: {trained} embeddings in {duration:.1f}s")
+            status, trained, duration = coordinated_train("startup", expected_generation=generation)
+            if status == BUSY:
+                logger.info("Another replica is training — waiting for the new generation...")
+                if not wait_for_generation(generation):
+                    logger.warning("Initial training on another replica published no generation (or timed out)")
+            else:
+                logger.info(f"Initial training {status}: {trained} embeddings in {duration:.1f}s")
         else:
             logger.info(f"Found {count} existing embeddings, skipping initial training")
     except Exception as e:
@@ -72,17 +114,35 @@ async def lifespan(_app: FastAPI):
         hour=settings.model_update_cron_hour,
         id="batch_train",
     )
+    scheduler.add_job(
+        _poll_generation,
+        "interval",
+        seconds=settings.generation_poll_seconds,
+        id="generation_poll",
+    )
+    scheduler.add_job(
+        _reload_cold_start,
+        "interval",
+        seconds=settings.cold_start_reload_seconds,
+        id="cold_start_reload",
+    )
     scheduler.start()
 
     # Start Kafka consumer
     start_consumer()
 
-    logger.info(f"Service started on port {settings.port}")
+    # Load + warm the NSFW model in worker processes; moderation answers 503 until ready
+    if settings.nsfw_preload:
+        ensure_inference_pool()
+
+    logger.info(f"Service started on port {settings.port} (node {NODE_ID})")
     yield
 
     # Shutdown
     scheduler.shutdown(wait=False)
     stop_consumer()
+    await shutdown_inference_pool()
+    await close_http_client()
     logger.info("Service stopped")
 
 
@@ -92,7 +152,9 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+app.add_middleware(MetricsMiddleware)
 app.include_router(moderation_router)
+app.include_router(admin_router)
 
 
 # ------------------------------------------------------------------
@@ -102,40 +164,65 @@ app.include_router(moderation_router)
 # ------------------------------------------------------------------
 
 
+def _page_limit(body: dict) -> int:
+    """`limit` from a recommendation request: an int in 1..ranked_list_depth (400 otherwise)."""
+    limit = body.get("limit", 50)
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= settings.ranked_list_depth:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be an integer between 1 and {settings.ranked_list_depth}",
+        )
+    return limit
+
+
 @app.post("/recommendations")
-async def recommend(body: dict):
+async def recommend(body: dict, response: Response):
     """
     ML recommendation endpoint.
-    Accepts {userId, limit, excludeIds} and returns [{userId, score}].
+    Accepts {userId, limit, excludeIds, cursor} and returns [{userId, score}].
+    Pages come from the user's cached ranked list; pass the X-Next-Cursor
+    response header back as `cursor` for the next page (absent on the last).
+    Users without an embedding get [{userId, score, coldStart: true}] from
+    the precomputed cold-start lists, marked with X-Recommendation-Source:
+    cold_start and a short Cache-Control max-age.
     """
     user_id = body.get("userId")
     if not user_id:
         raise HTTPException(status_code=400, detail="userId is required")
 
-    limit = body.get("limit", 50)
+    limit = _page_limit(body)
     exclude_ids = body.get("excludeIds", [])
 
-    # Check cache
-    cached = get_cached_recommendations(user_id)
-    if cached:
-        exclude_set = set(exclude_ids)
-        filtered = [r for r in cached if r["user_id"] not in exclude_set]
-        return [
-            {"userId": r["user_id"], "score": r["score"]}
-            for r in filtered[:limit]
-        ]
-
-    # Compute recommendations
-    recs = get_recommendations(user_id, limit=limit + 20, exclude_ids=exclude_ids)
-
-    if recs:
-        cache_recommendations(user_id, recs)
-
-    # Return in MlClientService-compatible format
-    return [
-        {"userId": r["user_id"], "score": r["score"]}
-        for r in recs[:limit]
-    ]
+    with request_stages("/recommendations", user_id=user_id):
+        try:
+            recs, next_cursor, hit = get_page(user_id, limit, exclude_ids, cursor=body.get("cursor"))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        CACHE_REQUESTS.labels("redis", "hit" if hit else "miss").inc()
+
+        if not recs:
+            # No embedding yet: precomputed segment lists (not cached, they're in memory)
+            with stage("cold_start"):
+                cold = get_cold_start_recommendations(user_id, limit=limit, exclude_ids=exclude_ids)
+            # Stand-in until the user's first embedding: callers shouldn't cache it for long
+            response.headers["X-Recommendation-Source"] = "cold_start"
+            response.headers["Cache-Control"] = f"max-age={settings.cold_start_cache_seconds}"
+            return [
+                {"userId": r["user_id"], "score": r["score"], "coldStart": True}
+                for r in cold
+            ]
+
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        # Return in MlClientService-compatible format
+        return [{"userId": r["user_id"], "score": r["score"]} for r in recs]
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
 @app.get("/health")
@@ -157,15 +244,52 @@ async def update_embedding(req: UpdateEmbeddingRequest):
     ok = update_single_embedding(req.user_id)
     if not ok:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_ranked_lists([req.user_id])
     return {"status": "updated", "user_id": req.user_id}
 
 
+@app.post("/update-embeddings", status_code=202, response_model=BulkUpdateJob)
+async def update_embeddings_bulk(req: BulkUpdateRequest):
+    """
+    Start a background refresh of many users' embeddings: either `user_ids`
+    or every user updated since `updated_since`. Poll the returned job id.
+    """
+    if (req.user_ids is None) == (req.updated_since is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of user_ids or updated_since")
+    if req.user_ids is not None and len(req.user_ids) > settings.bulk_update_max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.bulk_update_max_ids} user_ids per job (use updated_since for more)",
+        )
+    user_ids = [str(uid) for uid in req.user_ids] if req.user_ids is not None else None
+    return start_job(user_ids, req.updated_since)
+
+
+@app.get("/update-embeddings/{job_id}", response_model=BulkUpdateJob)
+async def update_embeddings_status(job_id: str):
+    """Progress and throughput of a bulk update job (from any replica)."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @app.post("/batch-update")
-async def batch_update():
-    """Trigger full batch retraining of all embeddings."""
-    count, duration = train_embeddings()
-    if count > 0:
-        invalidate_all_recs()
+def batch_update():
+    """
+    Trigger full batch retraining of all embeddings (on this node, if it wins the lease).
+    Plain def: FastAPI runs it on the threadpool, so the minutes-long run
+    doesn't block the event loop serving recommendations.
+    """
+    status, count, duration = coordinated_train("batch-update")
+    if status == BUSY:
+        lease = get_lease_info()
+        raise HTTPException(
+            status_code=409,
+            detail=f"Training already running on {lease['holder'] or 'another replica'}",
+        )
+    if status == LOST:
+        raise HTTPException(status_code=503, detail="Training lease was lost mid-run; no generation published")
     return BatchUpdateResponse(
         updated_count=count,
         duration_seconds=round(duration, 2),
@@ -181,13 +305,22 @@ async def recommend_typed(body: dict):
     if not user_id:
         raise HTTPException(status_code=400, detail="userId is required")
 
-    limit = body.get("limit", 50)
+    limit = _page_limit(body)
     exclude_ids = body.get("excludeIds") or body.get("exclude_ids") or []
 
-    recs = get_recommendations(user_id, limit=limit, exclude_ids=exclude_ids)
+    try:
+        recs, next_cursor, _ = get_page(user_id, limit, exclude_ids, cursor=body.get("cursor"))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    cold_start = False
+    if not recs:
+        recs = get_cold_start_recommendations(user_id, limit=limit, exclude_ids=exclude_ids)
+        cold_start = bool(recs)
     return RecommendResponse(
         recommendations=[
             RecommendationItem(user_id=r["user_id"], score=r["score"])
             for r in recs
-        ]
+        ],
+        cold_start=cold_start,
+        next_cursor=next_cursor,
     )
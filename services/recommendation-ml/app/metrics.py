@@ -0,0 +1,186 @@
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Prometheus metrics, scraped via GET /metrics. An observation is a lock and a
+# few float adds, so these hooks stay on in production.
+
+# Request latencies are mostly sub-10ms cache hits; training stages run for minutes
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+# --- Request side -----------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "ml_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["route", "method", "status"],
+    buckets=FAST_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "ml_cache_requests_total",
+    "Recommendation cache lookups by tier and result",
+    ["tier", "result"],
+)
+COLD_START_REQUESTS = Counter(
+    "ml_cold_start_requests_total",
+    "Recommendation requests for users without an embedding, by outcome",
+    ["result"],  # served, empty
+)
+KNN_QUERY_SECONDS = Histogram(
+    "ml_knn_query_duration_seconds",
+    "pgvector k-NN query time",
+    buckets=FAST_BUCKETS,
+)
+
+ANN_RECALL = Histogram(
+    "ml_ann_recall",
+    "recall@K of sampled IVFFlat queries against a shadow exact search",
+    ["probes"],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99, 1.0),
+)
+SHADOW_SEARCH_SECONDS = Histogram(
+    "ml_shadow_search_duration_seconds",
+    "Latency of sampled queries by search mode (ann = served, exact = shadow)",
+    ["mode"],
+    buckets=FAST_BUCKETS,
+)
+SHADOW_SAMPLES = Counter(
+    "ml_shadow_search_samples_total",
+    "Recall samples by outcome (measured, dropped, error)",
+    ["result"],
+)
+
+# --- Training side ----------------------------------------------------------
+
+TRAINING_STAGE_SECONDS = Histogram(
+    "ml_training_stage_duration_seconds",
+    "Duration of each training stage",
+    ["stage"],  # matrix_build, svd, feature_build, write, index, covisitation, cold_start
+    buckets=SLOW_BUCKETS,
+)
+TRAINING_MATRIX_NNZ = Gauge(
+    "ml_training_matrix_nnz",
+    "Non-zeros in the last interaction matrix",
+)
+TRAINING_USERS = Gauge(
+    "ml_training_users",
+    "Users embedded by the last training run",
+)
+BULK_UPDATE_USERS = Counter(
+    "ml_bulk_update_users_total",
+    "Users processed by bulk embedding jobs, by result",
+    ["result"],  # updated, missing
+)
+COVISIT_BYTES = Gauge(
+    "ml_covisit_bytes",
+    "Size of the last co-visitation build by part",
+    ["part"],  # neighbors (profile x profile), lists (stored per-user candidates)
+)
+
+# --- Kafka side -------------------------------------------------------------
+
+KAFKA_MESSAGES = Counter(
+    "ml_kafka_messages_total",
+    "Kafka messages processed by topic and result",
+    ["topic", "result"],
+)
+KAFKA_PROCESSING_SECONDS = Histogram(
+    "ml_kafka_processing_duration_seconds",
+    "Per-message processing time",
+    ["topic"],
+    buckets=FAST_BUCKETS,
+)
+KAFKA_CONSUMER_LAG = Gauge(
+    "ml_kafka_consumer_lag",
+    "Messages between the consumer position and the high watermark",
+    ["topic", "partition"],
+)
+
+# --- Moderation side --------------------------------------------------------
+
+NSFW_STAGE_SECONDS = Histogram(
+    "ml_nsfw_stage_duration_seconds",
+    "NSFW inference time split by stage",
+    ["stage"],  # fetch, decode, resize, model
+    buckets=FAST_BUCKETS,
+)
+NSFW_CACHE_REQUESTS = Counter(
+    "ml_nsfw_cache_requests_total",
+    "NSFW result cache lookups by key kind (url, content, phash) and result",
+    ["kind", "result"],
+)
+NSFW_CACHE_SAVED_SECONDS = Counter(
+    "ml_nsfw_cache_saved_seconds_total",
+    "Processing time avoided by NSFW cache hits (original cost of the cached result)",
+    ["kind"],
+)
+NSFW_BATCH_SIZE = Histogram(
+    "ml_nsfw_batch_size",
+    "Images per NSFW model forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+NSFW_PENDING = Gauge(
+    "ml_nsfw_pending_images",
+    "Images queued or running in the NSFW worker pool",
+)
+NSFW_REJECTED = Counter(
+    "ml_nsfw_rejected_total",
+    "NSFW requests turned away by admission control",
+    ["reason"],  # overloaded, not_ready
+)
+NSFW_WORKERS_READY = Gauge(
+    "ml_nsfw_workers_ready",
+    "1 once the NSFW worker pool has loaded and warmed the model",
+)
+
+
+def _status_class(status: int) -> str:
+    return f"{status // 100}xx"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route latency.
+
+    Labels use the matched route template (e.g. /api/moderation/nsfw), not
+    the raw path, so cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                getattr(route, "path", "unmatched"),
+                scope["method"],
+                _status_class(status),
+            ).observe(time.perf_counter() - start)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Serialize the default registry for a scrape. Returns (body, content_type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
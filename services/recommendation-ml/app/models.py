@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
+from uuid import UUID
 
 
 class RecommendRequest(BaseModel):
@@ -16,12 +17,32 @@ class RecommendationItem(BaseModel):
 
 class RecommendResponse(BaseModel):
     recommendations: list[RecommendationItem]
+    cold_start: bool = False  # served from precomputed lists (user has no embedding yet)
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
 
 
 class UpdateEmbeddingRequest(BaseModel):
     user_id: str
 
 
+class BulkUpdateRequest(BaseModel):
+    user_ids: Optional[list[UUID]] = None  # malformed ids are rejected (422) before a job starts
+    updated_since: Optional[datetime] = None  # every user whose row changed since then
+
+
+class BulkUpdateJob(BaseModel):
+    job_id: str
+    status: str  # queued, running, done, failed
+    node: str  # replica running the job
+    total: int
+    processed: int = 0
+    updated: int = 0
+    missing: int = 0  # ids without a users row
+    elapsed_seconds: float = 0.0
+    users_per_second: float = 0.0
+    error: Optional[str] = None
+
+
 class BatchUpdateResponse(BaseModel):
     updated_count: int
     duration_seconds: float
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from .config import settings
+from .metrics import NSFW_CACHE_REQUESTS, NSFW_CACHE_SAVED_SECONDS
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Bump when the model or preprocessing changes so old scores are not reused
+PREFIX = "nsfw:v2"
+PHASH_BANDS = 4  # 64-bit hash split into 4 x 16-bit bands for near lookups
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash (dHash): sign of horizontal gradients on a 9x8 thumbnail."""
+    small = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _phash_usable(phash: int) -> bool:
+    # Near-flat images hash to almost all 0s/1s and would collide with each other
+    ones = bin(phash).count("1")
+    return 8 <= ones <= 56
+
+
+def _bands(phash: int) -> list[str]:
+    return [f"{i}:{(phash >> (16 * i)) & 0xFFFF:04x}" for i in range(PHASH_BANDS)]
+
+
+def _url_key(url: str) -> str:
+    return f"{PREFIX}:url:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+
+def _hit(kind: str, entry: dict) -> dict:
+    NSFW_CACHE_REQUESTS.labels(kind, "hit").inc()
+    NSFW_CACHE_SAVED_SECONDS.labels(kind).inc(entry.get("cost_ms", 0) / 1000)
+    return entry
+
+
+def lookup_url(url: str) -> Optional[dict]:
+    """URL → content hash → cached result, without downloading anything."""
+    try:
+        r = get_redis()
+        digest = r.get(_url_key(url))
+        raw = r.get(f"{PREFIX}:res:{digest}") if digest else None
+    except Exception as e:
+        logger.warning(f"NSFW cache lookup failed: {e}")
+        return None
+    if raw:
+        return _hit("url", json.loads(raw))
+    NSFW_CACHE_REQUESTS.labels("url", "miss").inc()
+    return None
+
+
+def lookup_content(digest: str, url: Optional[str] = None) -> Optional[dict]:
+    """Exact-bytes lookup; also records the URL shortcut on a hit."""
+    try:
+        r = get_redis()
+        raw = r.get(f"{PREFIX}:res:{digest}")
+        if raw and url:
+            r.set(_url_key(url), digest, ex=settings.nsfw_cache_url_ttl)
+    except Exception as e:
+        logger.warning(f"NSFW cache lookup failed: {e}")
+        return None
+    if raw:
+        return _hit("content", json.loads(raw))
+    NSFW_CACHE_REQUESTS.labels("content", "miss").inc()
+    return None
+
+
+def lookup_similar(phash: int) -> Optional[dict]:
+    """
+    Find a cached result whose perceptual hash is within
+    `nsfw_phash_max_distance` bits. With 4 bands and distance <= 3, any match
+    shares at least one band exactly, so only band buckets are scanned.
+    """
+    if not settings.nsfw_phash_enabled or not _phash_usable(phash):
+        return None
+    try:
+        r = get_redis()
+        pipe = r.pipeline(transaction=False)
+        for band in _bands(phash):
+            pipe.smembers(f"{PREFIX}:band:{band}")
+        candidates = set().union(*pipe.execute())
+
+        best, best_distance = None, settings.nsfw_phash_max_distance + 1
+        for candidate in candidates:
+            distance = bin(int(candidate, 16) ^ phash).count("1")
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        raw = r.get(f"{PREFIX}:ph:{best}") if best else None
+    except Exception as e:
+        logger.warning(f"NSFW cache lookup failed: {e}")
+        return None
+    if raw:
+        return _hit("phash", json.loads(raw))
+    NSFW_CACHE_REQUESTS.labels("phash", "miss").inc()
+    return None
+
+
+def store(
+    digest: str,
+    nsfw_score: float,
+    cost_ms: int,
+    url: Optional[str] = None,
+    phash: Optional[int] = None,
+    frames_analyzed: int = 1,
+    frame_count: int = 1,
+):
+    """Cache a fresh score under its content hash (+ URL shortcut and phash)."""
+    ttl = settings.nsfw_cache_ttl
+    entry = {"nsfw_score": nsfw_score, "cost_ms": cost_ms}
+    if frame_count > 1:
+        entry.update(frames_analyzed=frames_analyzed, frame_count=frame_count)
+    entry = json.dumps(entry)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.set(f"{PREFIX}:res:{digest}", entry, ex=ttl)
+        if url:
+            pipe.set(_url_key(url), digest, ex=settings.nsfw_cache_url_ttl)
+        if phash is not None and settings.nsfw_phash_enabled and _phash_usable(phash):
+            hex_hash = f"{phash:016x}"
+            pipe.set(f"{PREFIX}:ph:{hex_hash}", entry, ex=ttl)
+            for band in _bands(phash):
+                pipe.sadd(f"{PREFIX}:band:{band}", hex_hash)
+                pipe.expire(f"{PREFIX}:band:{band}", ttl)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"NSFW cache store failed: {e}")
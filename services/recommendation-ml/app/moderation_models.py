@@ -12,3 +12,22 @@ class NsfwResponse(BaseModel):
     category: str  # "safe", "suggestive", "nsfw"
     safe: bool
     processing_time_ms: int
+    cached: bool = False
+    frames_analyzed: int = 1  # frames scored (animated images are sampled)
+    frame_count: int = 1  # frames in the image
+
+
+class NsfwBatchRequest(BaseModel):
+    images: list[NsfwRequest] = Field(min_length=1)
+
+
+class NsfwBatchItem(BaseModel):
+    index: int
+    result: Optional[NsfwResponse] = None
+    error: Optional[str] = None
+    retryable: bool = False  # overloaded / model loading: retry later, don't treat as scored
+
+
+class NsfwBatchResponse(BaseModel):
+    results: list[NsfwBatchItem]
+    processing_time_ms: int
@@ -1,14 +1,33 @@
+import asyncio
 import logging
+import time
 
 from fastapi import APIRouter, HTTPException
 
-from .moderation_models import NsfwRequest, NsfwResponse
-from .nsfw_detector import predict
+from .config import settings
+from .moderation_models import (
+    NsfwBatchItem,
+    NsfwBatchRequest,
+    NsfwBatchResponse,
+    NsfwRequest,
+    NsfwResponse,
+)
+from .nsfw_batcher import Overloaded
+from .nsfw_detector import ModelNotReady, inference_status, predict
 
 logger = logging.getLogger(__name__)
 
 moderation_router = APIRouter(prefix="/api/moderation", tags=["moderation"])
 
+RETRY_AFTER = {"Retry-After": "1"}
+
+
+def _unavailable(exc: Exception) -> HTTPException:
+    """429 when the worker queue is full, 503 while the model is loading."""
+    if isinstance(exc, Overloaded):
+        return HTTPException(status_code=429, detail="NSFW detection is overloaded", headers=RETRY_AFTER)
+    return HTTPException(status_code=503, detail=str(exc), headers=RETRY_AFTER)
+
 
 @moderation_router.post("/nsfw", response_model=NsfwResponse)
 async def detect_nsfw(body: NsfwRequest):
@@ -20,12 +39,14 @@ async def detect_nsfw(body: NsfwRequest):
         )
 
     try:
-        result = predict(
+        result = await predict(
             image_url=body.image_url,
             image_base64=body.image_base64,
         )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
+    except (Overloaded, ModelNotReady) as exc:
+        raise _unavailable(exc)
     except Exception as exc:
         logger.error(f"NSFW detection failed: {exc}")
         raise HTTPException(status_code=500, detail="NSFW detection failed")
@@ -33,7 +54,55 @@ async def detect_nsfw(body: NsfwRequest):
     return NsfwResponse(**result)
 
 
+@moderation_router.post("/nsfw/batch", response_model=NsfwBatchResponse)
+async def detect_nsfw_batch(body: NsfwBatchRequest):
+    """
+    Analyse many images in one call (e.g. an album upload).
+    Per-image errors are reported per item; the rest are still scored.
+    """
+    if len(body.images) > settings.nsfw_batch_max_images:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.nsfw_batch_max_images} images per batch",
+        )
+
+    status = inference_status()
+    if not status["ready"]:
+        raise _unavailable(ModelNotReady("NSFW model is loading"))
+    if status["max_pending"] and status["pending"] + len(body.images) > status["max_pending"]:
+        raise _unavailable(Overloaded())
+
+    start = time.time()
+    # Each item goes through the cache; misses meet again in the batcher
+    outcomes = await asyncio.gather(
+        *(predict(image_url=item.image_url, image_base64=item.image_base64) for item in body.images),
+        return_exceptions=True,
+    )
+
+    items = []
+    for i, outcome in enumerate(outcomes):
+        if isinstance(outcome, (Overloaded, ModelNotReady)):
+            items.append(NsfwBatchItem(index=i, error=str(outcome) or "NSFW detection is overloaded", retryable=True))
+        elif isinstance(outcome, ValueError):
+            items.append(NsfwBatchItem(index=i, error=str(outcome)))
+        elif isinstance(outcome, BaseException):
+            logger.error(f"NSFW batch item {i} failed: {outcome}")
+            items.append(NsfwBatchItem(index=i, error="NSFW detection failed"))
+        else:
+            items.append(NsfwBatchItem(index=i, result=NsfwResponse(**outcome)))
+
+    return NsfwBatchResponse(
+        results=items,
+        processing_time_ms=int((time.time() - start) * 1000),
+    )
+
+
 @moderation_router.get("/health")
 async def moderation_health():
-    """Health check for the moderation sub-system."""
-    return {"status": "ok", "service": "nsfw-moderation"}
+    """Health check for the moderation sub-system (status "loading" until the workers are warm)."""
+    status = inference_status()
+    return {
+        "status": "ok" if status["ready"] else "loading",
+        "service": "nsfw-moderation",
+        **status,
+    }
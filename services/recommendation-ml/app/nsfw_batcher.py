@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(RuntimeError):
+    """More images are pending than the batcher admits."""
+
+
+class DynamicBatcher:
+    """
+    Groups concurrent single-image requests into one model forward pass.
+
+    The first queued image opens a batch; it is flushed when `max_batch_size`
+    images have arrived or `max_wait_ms` has elapsed, whichever comes first.
+    Up to `concurrency` batches run at once on `executor` (one per worker
+    process), so images arriving while every worker is busy simply form the
+    next batch. With `max_pending` set, submissions that would push queued +
+    running images past it fail fast with `Overloaded`.
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int,
+        max_wait_ms: float,
+        executor: Optional[Executor] = None,
+        concurrency: int = 1,
+        max_pending: int = 0,
+        on_batch: Optional[Callable[[int, float], None]] = None,
+    ):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max_pending
+        self.on_batch = on_batch
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="nsfw-infer")
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Images queued or running."""
+        return self._pending
+
+    def has_capacity(self, count: int = 1) -> bool:
+        return not self.max_pending or self._pending + count <= self.max_pending
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._tasks and all(not t.done() and t.get_loop() is loop for t in self._tasks):
+            return
+        # First use, or a worker died / belonged to another loop
+        for task in self._tasks:
+            task.cancel()
+        self._queue = asyncio.Queue()
+        self._tasks = [loop.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+
+    async def submit(self, image: np.ndarray) -> float:
+        """Score one preprocessed image; resolves when its batch has run."""
+        return (await self.submit_many([image]))[0]
+
+    async def submit_many(self, images: list[np.ndarray]) -> list[float]:
+        """Score several images; they may be split across or share batches."""
+        if not self.has_capacity(len(images)):
+            raise Overloaded(f"{self._pending} images pending (max {self.max_pending})")
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in images]
+        self._pending += len(images)
+        for image, future in zip(images, futures):
+            future.add_done_callback(self._release)
+            self._queue.put_nowait((image, future))
+        return list(await asyncio.gather(*futures))
+
+    def _release(self, _future: asyncio.Future):
+        self._pending -= 1
+
+    async def _collect(self) -> list[tuple[np.ndarray, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip callers that gave up (e.g. client disconnected)
+            batch = [(img, fut) for img, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                scores = await loop.run_in_executor(
+                    self._executor, self.infer_fn, np.stack([img for img, _ in batch]),
+                )
+            except Exception as exc:
+                logger.error(f"NSFW batch of {len(batch)} failed: {exc!r}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                continue
+            if self.on_batch is not None:
+                self.on_batch(len(batch), time.perf_counter() - started)
+            for (_, fut), score in zip(batch, scores):
+                if not fut.done():
+                    fut.set_result(float(score))
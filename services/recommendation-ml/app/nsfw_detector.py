@@ -1,44 +1,62 @@
+import asyncio
 import base64
-import io
+import binascii
 import logging
+import multiprocessing
 import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Optional, Tuple
 
+import httpx
 import numpy as np
-import requests
 from PIL import Image
 
-logger = logging.getLogger(__name__)
+from . import nsfw_worker
+from .config import settings
+from .image_ingest import decode_frames, fetch_image_bytes
+from .metrics import (
+    NSFW_BATCH_SIZE,
+    NSFW_PENDING,
+    NSFW_REJECTED,
+    NSFW_STAGE_SECONDS,
+    NSFW_WORKERS_READY,
+)
+from .moderation_cache import (
+    content_hash,
+    lookup_content,
+    lookup_similar,
+    lookup_url,
+    perceptual_hash,
+    store,
+)
+from .nsfw_batcher import DynamicBatcher, Overloaded
+from .nsfw_worker import INPUT_SIZE
 
-_model = None
+logger = logging.getLogger(__name__)
 
 
-def _load_model():
-    """Lazy-load the opennsfw2 model on first request."""
-    global _model
-    if _model is None:
-        logger.info("Loading opennsfw2 model (first request)...")
-        import opennsfw2
+class ModelNotReady(RuntimeError):
+    """The inference workers are not started, still warming up, or restarting."""
 
-        _model = opennsfw2
-        logger.info("opennsfw2 model loaded successfully")
-    return _model
 
+_pool: Optional[ProcessPoolExecutor] = None
+_batcher: Optional[DynamicBatcher] = None
+_pool_lock = asyncio.Lock()
+_starting: Optional[asyncio.Task] = None
 
-def _image_from_url(url: str) -> Image.Image:
-    """Download an image from a URL and return a PIL Image."""
-    response = requests.get(url, timeout=10, stream=True)
-    response.raise_for_status()
-    return Image.open(io.BytesIO(response.content)).convert("RGB")
+NSFW_PENDING.set_function(lambda: _batcher.pending if _batcher is not None else 0)
 
 
-def _image_from_base64(data: str) -> Image.Image:
-    """Decode a base64 string and return a PIL Image."""
+def _bytes_from_base64(data: str) -> bytes:
+    """Decode a base64 string into raw image bytes (at most `image_max_bytes`)."""
     # Strip optional data-URI prefix (e.g. "data:image/png;base64,")
     if "," in data:
         data = data.split(",", 1)[1]
-    image_bytes = base64.b64decode(data)
-    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    # 4 characters per 3 bytes, plus padding and line breaks some encoders add
+    if len(data) > settings.image_max_bytes * 4 // 3 + 1024:
+        raise ValueError(f"Image exceeds {settings.image_max_bytes} bytes")
+    return base64.b64decode(data)
 
 
 def _categorize(score: float) -> Tuple[str, bool]:
@@ -51,42 +69,72 @@ def _categorize(score: float) -> Tuple[str, bool]:
         return "nsfw", False
 
 
-def predict(
+def _to_model_input(image: Image.Image) -> np.ndarray:
+    """256x256 uint8 RGB; the workers run the rest of the YAHOO preprocessing."""
+    # Separate from "decode": _decode's own timing already covers the frames
+    with NSFW_STAGE_SECONDS.labels("resize").time():
+        return np.asarray(image.resize((INPUT_SIZE, INPUT_SIZE), Image.BILINEAR), dtype=np.uint8)
+
+
+async def _load_bytes(
     image_url: Optional[str] = None,
     image_base64: Optional[str] = None,
-) -> dict:
-    """
-    Run NSFW detection on an image supplied via URL or base64.
+) -> bytes:
+    """Fetch (URL) or decode (base64) the raw image bytes."""
+    try:
+        with NSFW_STAGE_SECONDS.labels("fetch").time():
+            if image_url:
+                return await fetch_image_bytes(image_url)
+            elif image_base64:
+                return await asyncio.to_thread(_bytes_from_base64, image_base64)
+            else:
+                raise ValueError("Either image_url or image_base64 must be provided")
+    except ValueError:
+        raise
+    except (httpx.HTTPError, binascii.Error) as exc:
+        raise ValueError(f"Failed to load image: {exc}") from exc
 
-    Returns a dict with keys: nsfw_score, category, safe, processing_time_ms.
-    Raises ValueError for invalid / unreadable images.
-    """
-    start = time.time()
 
-    # Load image
+def _decode(image_bytes: bytes) -> Tuple[list[Image.Image], int, Optional[int]]:
+    """
+    Reduced-size decode of the frames to score, the total frame count and the
+    perceptual hash (stills only, when near-duplicate lookup is on — frame 0
+    says nothing about the rest of an animation).
+    """
     try:
-        if image_url:
-            image = _image_from_url(image_url)
-        elif image_base64:
-            image = _image_from_base64(image_base64)
-        else:
-            raise ValueError("Either image_url or image_base64 must be provided")
-    except (requests.RequestException, base64.binascii.Error) as exc:
-        raise ValueError(f"Failed to load image: {exc}") from exc
+        with NSFW_STAGE_SECONDS.labels("decode").time():
+            frames, frame_count = decode_frames(image_bytes)
+            phash = None
+            if settings.nsfw_phash_enabled and frame_count == 1:
+                phash = perceptual_hash(frames[0])
+    except ValueError:
+        raise
     except Exception as exc:
         raise ValueError(f"Invalid image data: {exc}") from exc
+    return frames, frame_count, phash
+
 
-    # Resize to the size expected by opennsfw2 (224x224)
-    image_resized = image.resize((224, 224))
-    img_array = np.array(image_resized, dtype=np.float32)
-    # opennsfw2.preprocess_image expects (H, W, 3) or a batch
-    img_array = np.expand_dims(img_array, axis=0)
+def _aggregate(scores: list[float]) -> float:
+    """One score per animation: max by default, or a percentile to ignore lone flickers."""
+    if len(scores) == 1:
+        return scores[0]
+    return float(np.percentile(scores, settings.nsfw_frame_percentile))
 
-    # Run prediction
-    nsfw2 = _load_model()
-    predictions = nsfw2.predict_image(image)
-    nsfw_score = float(predictions)
 
+def _observe_batch(size: int, seconds: float):
+    # Recorded here because metrics in the worker processes are never scraped
+    NSFW_BATCH_SIZE.observe(size)
+    NSFW_STAGE_SECONDS.labels("model").observe(seconds)
+
+
+def build_result(
+    nsfw_score: float,
+    start: float,
+    cached: bool = False,
+    frames_analyzed: int = 1,
+    frame_count: int = 1,
+) -> dict:
+    """Shape a score into the NsfwResponse dict (`start` is a time.time() stamp)."""
     category, safe = _categorize(nsfw_score)
     elapsed_ms = int((time.time() - start) * 1000)
 
@@ -95,4 +143,196 @@ def predict(
         "category": category,
         "safe": safe,
         "processing_time_ms": elapsed_ms,
+        "cached": cached,
+        "frames_analyzed": frames_analyzed,
+        "frame_count": frame_count,
+    }
+
+
+def _set_ready(ready: bool):
+    global _batcher
+    if not ready:
+        _batcher = None
+    NSFW_WORKERS_READY.set(1 if ready else 0)
+
+
+async def start_inference_pool():
+    """
+    Spawn `nsfw_workers` processes and wait until they have loaded and warmed
+    the model. Until then (and while restarting after a crash) predict()
+    raises ModelNotReady instead of making a request pay the cold start.
+    """
+    global _pool, _batcher
+    async with _pool_lock:
+        if _batcher is not None:
+            return
+        workers = max(1, settings.nsfw_workers)
+        started = time.perf_counter()
+        # spawn, not fork: the parent has Kafka/scheduler threads running
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=nsfw_worker.init_worker,
+            initargs=(settings.nsfw_worker_threads, settings.nsfw_max_batch_size),
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            # One ping per worker; each blocks until its initializer has finished
+            await asyncio.gather(*(loop.run_in_executor(pool, nsfw_worker.ping) for _ in range(workers)))
+        except Exception:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        _pool = pool
+        _batcher = DynamicBatcher(
+            nsfw_worker.infer_batch,
+            max_batch_size=settings.nsfw_max_batch_size,
+            max_wait_ms=settings.nsfw_max_wait_ms,
+            executor=pool,
+            concurrency=workers,
+            max_pending=settings.nsfw_max_pending,
+            on_batch=_observe_batch,
+        )
+        _set_ready(True)
+        logger.info(f"NSFW worker pool ready: {workers} workers in {time.perf_counter() - started:.1f}s")
+
+
+def ensure_inference_pool():
+    """Start the worker pool in the background unless it is up or already starting."""
+    global _starting
+    if _batcher is None and (_starting is None or _starting.done()):
+        _starting = asyncio.get_running_loop().create_task(_start_logged())
+
+
+async def _start_logged():
+    try:
+        await start_inference_pool()
+    except Exception as e:
+        logger.error(f"NSFW worker pool failed to start: {e!r}")
+
+
+async def _teardown():
+    global _pool
+    batcher, pool = _batcher, _pool
+    _set_ready(False)
+    _pool = None
+    if batcher is not None:
+        await batcher.stop()
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _restart_pool(broken: DynamicBatcher):
+    async with _pool_lock:
+        if _batcher is not broken:
+            return  # already torn down or restarted by another caller
+        await _teardown()
+    logger.warning("NSFW worker pool broke — restarting")
+    await _start_logged()
+
+
+async def shutdown_inference_pool():
+    async with _pool_lock:
+        await _teardown()
+
+
+def inference_status() -> dict:
+    return {
+        "ready": _batcher is not None,
+        "workers": settings.nsfw_workers,
+        "pending": _batcher.pending if _batcher is not None else 0,
+        "max_pending": settings.nsfw_max_pending,
     }
+
+
+async def _score(images: list[np.ndarray]) -> list[float]:
+    """Admission control + batched inference on the worker pool."""
+    batcher = _batcher
+    if batcher is None:
+        ensure_inference_pool()
+        NSFW_REJECTED.labels("not_ready").inc()
+        raise ModelNotReady("NSFW model is loading")
+    try:
+        return await batcher.submit_many(images)
+    except Overloaded:
+        NSFW_REJECTED.labels("overloaded").inc()
+        raise
+    except BrokenProcessPool as exc:
+        # A worker died (e.g. OOM-killed); callers get 503 until it is back
+        asyncio.get_running_loop().create_task(_restart_pool(batcher))
+        raise ModelNotReady("NSFW workers are restarting") from exc
+
+
+def _cached_result(hit: dict, start: float) -> dict:
+    return build_result(
+        hit["nsfw_score"],
+        start,
+        cached=True,
+        frames_analyzed=hit.get("frames_analyzed", 1),
+        frame_count=hit.get("frame_count", 1),
+    )
+
+
+async def predict(
+    image_url: Optional[str] = None,
+    image_base64: Optional[str] = None,
+) -> dict:
+    """
+    Run NSFW detection on an image supplied via URL or base64.
+
+    Hashing, base64 decoding and cache round-trips run on worker threads,
+    so a moderation burst (or a slow Redis) never holds the event loop that
+    serves recommendations.
+
+    Checks the result cache at each step before paying for the next one:
+    URL shortcut (skips the download), exact content hash (skips decode),
+    then perceptual hash (skips the model). Concurrent misses share model
+    forward passes on the worker pool.
+
+    Animated images are scored on sampled frames (see image_ingest.decode_frames)
+    and aggregated with `nsfw_frame_percentile`.
+
+    Returns a dict with keys: nsfw_score, category, safe, processing_time_ms,
+    cached, frames_analyzed, frame_count.
+    Raises ValueError for invalid / unreadable images, Overloaded when the
+    worker queue is full and ModelNotReady while the workers are warming up.
+    """
+    start = time.time()
+    if image_url:
+        hit = await asyncio.to_thread(lookup_url, image_url)
+        if hit:
+            return _cached_result(hit, start)
+
+    image_bytes = await _load_bytes(image_url=image_url, image_base64=image_base64)
+    digest = await asyncio.to_thread(content_hash, image_bytes)
+    hit = await asyncio.to_thread(lookup_content, digest, image_url)
+    if hit:
+        return _cached_result(hit, start)
+
+    frames, frame_count, phash = await asyncio.to_thread(_decode, image_bytes)
+    if phash is not None:
+        hit = await asyncio.to_thread(lookup_similar, phash)
+        if hit:
+            # Remember these exact bytes too so the next lookup skips decoding
+            await asyncio.to_thread(store, digest, hit["nsfw_score"], hit.get("cost_ms", 0), url=image_url)
+            return _cached_result(hit, start)
+
+    model_inputs = await asyncio.to_thread(lambda: [_to_model_input(frame) for frame in frames])
+    # All sampled frames are queued together, so they share a forward pass
+    nsfw_score = _aggregate(await _score(model_inputs))
+    result = build_result(
+        nsfw_score,
+        start,
+        frames_analyzed=len(frames),
+        frame_count=frame_count,
+    )
+    await asyncio.to_thread(
+        store,
+        digest,
+        nsfw_score,
+        result["processing_time_ms"],
+        url=image_url,
+        phash=phash,
+        frames_analyzed=len(frames),
+        frame_count=frame_count,
+    )
+    return result
@@ -0,0 +1,69 @@
+"""
+Code that runs inside the NSFW inference worker processes.
+
+Kept free of app imports (config, Redis, metrics) so a spawned worker only
+pays for numpy, Pillow and TensorFlow. The parent process never imports
+TensorFlow at all.
+"""
+import logging
+import os
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Parent resizes to this before shipping; matches opennsfw2's YAHOO first step
+INPUT_SIZE = 256
+
+_model = None
+
+
+def load_model(threads: int = 0):
+    """Load the opennsfw2 Keras model once per process."""
+    global _model
+    if _model is None:
+        import tensorflow as tf
+
+        if threads > 0:
+            # N workers x all cores would oversubscribe the CPU
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        import opennsfw2
+
+        _model = opennsfw2.make_open_nsfw_model()
+    return _model
+
+
+def init_worker(threads: int = 0, warmup_batch_size: int = 1):
+    """ProcessPoolExecutor initializer: load the model and trace the graph."""
+    logging.basicConfig(level=logging.INFO)
+    load_model(threads)
+    warmup = np.zeros((max(1, warmup_batch_size), INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8)
+    infer_batch(warmup)
+    logger.info(f"NSFW worker {os.getpid()} ready")
+
+
+def ping() -> int:
+    """Round-trip used by the parent to wait for warm-up."""
+    return os.getpid()
+
+
+def preprocess_batch(batch: np.ndarray) -> np.ndarray:
+    """(N, 256, 256, 3) uint8 RGB → (N, 224, 224, 3) float32 model inputs."""
+    import opennsfw2
+
+    return np.stack([
+        opennsfw2.preprocess_image(Image.fromarray(image), opennsfw2.Preprocessing.YAHOO)
+        for image in batch
+    ])
+
+
+def forward(inputs: np.ndarray) -> np.ndarray:
+    """One model forward pass over preprocessed inputs → N NSFW probabilities."""
+    return np.asarray(load_model()(inputs, training=False))[:, 1]
+
+
+def infer_batch(batch: np.ndarray) -> np.ndarray:
+    """Score a stacked batch of 256x256 uint8 images."""
+    return forward(preprocess_batch(batch))
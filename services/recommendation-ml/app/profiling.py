@@ -0,0 +1,248 @@
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Only one profiling session at a time (cProfile/tracemalloc are process-wide)
+_session_lock = threading.Lock()
+_reports: dict[str, dict] = {}
+
+
+# ------------------------------------------------------------------
+# Per-request stage timings (slow-request log)
+# ------------------------------------------------------------------
+
+
+class StageTimer:
+    """Accumulates wall time per named stage for one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("ml_stage_timer", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the current request, if the request is being timed."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+@contextmanager
+def request_stages(route: str, **context):
+    """
+    Time the stages of one request and log a breakdown when it exceeds
+    `slow_request_ms`. A no-op when the threshold is 0.
+    """
+    if settings.slow_request_ms <= 0:
+        yield None
+        return
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+        total = timer.elapsed_ms()
+        if total >= settings.slow_request_ms:
+            breakdown = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in timer.stages.items())
+            extra = " ".join(f"{k}={v}" for k, v in context.items())
+            logger.warning(f"Slow request {route} {total:.1f}ms ({breakdown}) {extra}".rstrip())
+
+
+# ------------------------------------------------------------------
+# On-demand CPU + allocation profiling
+# ------------------------------------------------------------------
+
+
+def _start_session() -> tuple[cProfile.Profile, bool]:
+    profiler = cProfile.Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(settings.profile_trace_frames)
+    profiler.enable()
+    return profiler, started_tracing
+
+
+def _stop_session(report: dict, profiler: cProfile.Profile, started_tracing: bool):
+    """Stop profiling and fill `report` with top functions and allocation sites."""
+    profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    if started_tracing:
+        tracemalloc.stop()
+
+    top_n = settings.profile_top_n
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:top_n]
+    report["top_functions"] = [
+        {
+            "function": func,
+            "file": filename,
+            "line": line,
+            "calls": nc,
+            "total_time": round(tt, 6),
+            "cumulative_time": round(ct, 6),
+        }
+        for (filename, line, func), (_cc, nc, tt, ct, _callers) in rows
+    ]
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    report["top_allocations"] = [
+        {
+            "site": str(stat.traceback),
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:top_n]
+    ]
+    report["peak_memory_kb"] = round(peak / 1024, 1)
+    report["duration_seconds"] = round(time.time() - report["_t0"], 3)
+    report["status"] = "done"
+
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    stats.dump_stats(_artifact_path(report["id"], "prof"))
+    _save(report)
+
+
+def _new_report(kind: str, label: str) -> dict:
+    report_id = uuid.uuid4().hex[:12]
+    report = {
+        "id": report_id,
+        "kind": kind,
+        "label": label,
+        "status": "running",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "_t0": time.time(),
+    }
+    _reports[report_id] = report
+    return report
+
+
+def _artifact_path(report_id: str, ext: str) -> str:
+    if not report_id.isalnum():
+        raise ValueError(f"Invalid report id: {report_id}")
+    return os.path.join(settings.profile_dir, f"{report_id}.{ext}")
+
+
+def _save(report: dict):
+    public = {k: v for k, v in report.items() if not k.startswith("_")}
+    with open(_artifact_path(report["id"], "json"), "w") as f:
+        json.dump(public, f, indent=2, default=str)
+
+
+def profile_in_background(label: str, fn: Callable[[], object]) -> dict:
+    """
+    Run `fn` in a background thread under cProfile + tracemalloc.
+    Returns the (running) report; raises RuntimeError if a session is active.
+    """
+    if not _session_lock.acquire(blocking=False):
+        raise RuntimeError("A profiling session is already running")
+    report = _new_report("job", label)
+
+    def _run():
+        try:
+            profiler, started_tracing = _start_session()
+            try:
+                report["result"] = fn()
+            except Exception as e:
+                report["error"] = str(e)
+                logger.error(f"Profiled job {label} failed: {e}")
+            finally:
+                _stop_session(report, profiler, started_tracing)
+            logger.info(f"Profile {report['id']} ({label}) done in {report['duration_seconds']}s")
+        finally:
+            _session_lock.release()
+
+    threading.Thread(target=_run, daemon=True, name=f"profile-{report['id']}").start()
+    return report
+
+
+def start_request_window(seconds: float) -> dict:
+    """
+    Profile everything running on the calling (event loop) thread for `seconds`.
+    Must be called from the event loop; live requests are sampled as they run.
+    """
+    if not _session_lock.acquire(blocking=False):
+        raise RuntimeError("A profiling session is already running")
+    report = _new_report("requests", f"{seconds:g}s request window")
+    try:
+        profiler, started_tracing = _start_session()
+    except Exception:
+        _session_lock.release()
+        raise
+
+    def _finish():
+        try:
+            _stop_session(report, profiler, started_tracing)
+            logger.info(f"Profile {report['id']} (request window) done")
+        finally:
+            _session_lock.release()
+
+    asyncio.get_running_loop().call_later(seconds, _finish)
+    return report
+
+
+def get_report(report_id: str) -> Optional[dict]:
+    """Get a profile report from memory or, after a restart, from disk."""
+    report = _reports.get(report_id)
+    if report is None:
+        if not report_id.isalnum():
+            return None
+        path = _artifact_path(report_id, "json")
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return None
+    return {k: v for k, v in report.items() if not k.startswith("_")}
+
+
+def list_reports() -> list[dict]:
+    """Summaries of the profile reports held in memory, newest first."""
+    return [
+        {k: r.get(k) for k in ("id", "kind", "label", "status", "started_at", "duration_seconds")}
+        for r in sorted(_reports.values(), key=lambda r: r["_t0"], reverse=True)
+    ]
+
+
+def get_artifact_path(report_id: str) -> Optional[str]:
+    """Path of the raw pstats dump for a finished report."""
+    if not report_id.isalnum():
+        return None
+    path = _artifact_path(report_id, "prof")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,115 @@
+import base64
+import binascii
+import logging
+import struct
+import zlib
+from typing import Optional
+
+from .config import settings
+from .coordination import get_local_generation
+from .covisitation import blend_candidates, get_covisit_candidates
+from .engine import get_recommendations
+from .profiling import stage
+from .redis_client import RECORD, decode_ranked, encode_ranked, get_binary_redis
+
+logger = logging.getLogger(__name__)
+
+_CURSOR = struct.Struct(">IQI")  # user check, generation, offset
+
+
+def _key(generation: int, user_id: str) -> str:
+    return f"ml_ranked:{generation}:{user_id}"
+
+
+def encode_cursor(user_id: str, generation: int, offset: int) -> str:
+    packed = _CURSOR.pack(zlib.crc32(user_id.encode("utf-8")), generation, offset)
+    return base64.urlsafe_b64encode(packed).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(user_id: str, cursor: str) -> tuple[int, int]:
+    """(generation, offset) from a cursor; ValueError if malformed or issued to another user."""
+    try:
+        packed = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        check, generation, offset = _CURSOR.unpack(packed)
+    except (binascii.Error, struct.error, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if check != zlib.crc32(user_id.encode("utf-8")):
+        raise ValueError("Cursor was issued for a different user")
+    return generation, offset
+
+
+def get_page(
+    user_id: str,
+    limit: int,
+    exclude_ids: list[str] | None = None,
+    cursor: Optional[str] = None,
+) -> tuple[list[dict], Optional[str], bool]:
+    """
+    One page of the user's ranked list for the current model generation.
+
+    The list (`ranked_list_depth` deep) is computed by the k-NN, blended with
+    the user's co-visitation candidates, once per user and generation; later
+    pages only read `limit + len(exclude_ids)` records from Redis and drop
+    excluded ids, so page N costs the same as page 1.
+    A cursor from an older generation keeps paging its own list while it
+    lives; if that list has expired, paging restarts on the current one.
+    Returns (recs, next_cursor, cache_hit). Raises ValueError for bad cursors.
+    """
+    if limit <= 0:
+        return [], None, False
+    exclude = set(exclude_ids or [])
+    current = get_local_generation() or 0
+    generation, offset = decode_cursor(user_id, cursor) if cursor else (current, 0)
+
+    want = limit + len(exclude)
+    r = get_binary_redis()
+    pipe = r.pipeline(transaction=False)
+    pipe.getrange(_key(generation, user_id), offset * RECORD.itemsize, (offset + want) * RECORD.itemsize - 1)
+    pipe.strlen(_key(generation, user_id))
+    with stage("cache_lookup"):
+        raw, total_bytes = pipe.execute()
+
+    hit = total_bytes > 0
+    if not hit:
+        if generation != current:
+            generation, offset = current, 0
+        recs = get_recommendations(user_id, limit=settings.ranked_list_depth)
+        if settings.covisit_blend > 0:
+            with stage("covisit"):
+                covisit = get_covisit_candidates(user_id)
+            recs = blend_candidates(recs, covisit, settings.covisit_blend, settings.ranked_list_depth)
+        if not recs:
+            return [], None, False
+        blob = encode_ranked(recs)
+        with stage("cache_write"):
+            r.set(_key(generation, user_id), blob, ex=settings.ml_recs_cache_ttl)
+        raw, total_bytes = blob[offset * RECORD.itemsize:(offset + want) * RECORD.itemsize], len(blob)
+
+    page, consumed = [], 0
+    for rec in decode_ranked(raw):
+        consumed += 1
+        if rec["user_id"] in exclude:
+            continue
+        page.append(rec)
+        if len(page) >= limit:
+            break
+
+    next_offset = offset + consumed
+    has_more = next_offset < total_bytes // RECORD.itemsize
+    next_cursor = encode_cursor(user_id, generation, next_offset) if has_more else None
+    return page, next_cursor, hit
+
+
+def invalidate_ranked_lists(user_ids: list[str]):
+    """
+    Drop these users' cached lists for the current generation, and the
+    matching-service response cache (ml_recs:{userId}) that may still hold a
+    cold-start answer from before their first embedding (one pipelined pass).
+    """
+    if not user_ids:
+        return
+    generation = get_local_generation() or 0
+    pipe = get_binary_redis().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.unlink(_key(generation, user_id), f"ml_recs:{user_id}")
+    pipe.execute()
@@ -0,0 +1,89 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import settings
+from .database import get_cursor
+from .metrics import ANN_RECALL, SHADOW_SAMPLES, SHADOW_SEARCH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Shadow queries run on one background thread, never on the request path
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recall-monitor")
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def maybe_sample(
+    user_id: str,
+    user_embedding,
+    exclude_ids: list[str],
+    ann_rows: list[dict],
+    ann_seconds: float,
+    k: int,
+    segments: list[str] | None = None,
+    probes: int = 1,
+):
+    """
+    With probability `recall_sample_rate`, queue an exact re-run of a k-NN
+    query whose IVFFlat result was `ann_rows`. Samples are dropped (not queued)
+    when `recall_max_pending` shadow queries are already outstanding.
+    """
+    global _pending
+    if settings.recall_sample_rate <= 0 or random.random() >= settings.recall_sample_rate:
+        return
+    with _pending_lock:
+        if _pending >= settings.recall_max_pending:
+            SHADOW_SAMPLES.labels("dropped").inc()
+            return
+        _pending += 1
+    ann_ids = [str(r["user_id"]) for r in ann_rows]
+    _executor.submit(_shadow_exact, user_id, user_embedding, exclude_ids, ann_ids, ann_seconds, k, segments, probes)
+
+
+def _shadow_exact(
+    user_id: str,
+    user_embedding,
+    exclude_ids: list[str],
+    ann_ids: list[str],
+    ann_seconds: float,
+    k: int,
+    segments: list[str] | None = None,
+    probes: int = 1,
+):
+    """Brute-force the same query (index scans off) and record recall@K."""
+    global _pending
+    try:
+        with get_cursor() as cur:
+            # Without the ivfflat index pgvector falls back to an exact scan
+            cur.execute("SET LOCAL enable_indexscan = off")
+            start = time.perf_counter()
+            # Same segment filter as the ANN query, so recall compares like with like
+            segment_filter = "AND segment = ANY(%s)" if segments else ""
+            params = (user_id, exclude_ids, *([segments] if segments else []), user_embedding, k)
+            cur.execute(f"""
+                SELECT user_id
+                FROM user_embeddings
+                WHERE user_id != %s
+                  AND user_id != ALL(%s::uuid[])
+                  {segment_filter}
+                ORDER BY embedding <=> %s
+                LIMIT %s
+            """, params)
+            exact_ids = [str(r["user_id"]) for r in cur.fetchall()]
+            exact_seconds = time.perf_counter() - start
+
+        if exact_ids:
+            recall = len(set(ann_ids[:k]) & set(exact_ids)) / len(exact_ids)
+            ANN_RECALL.labels(str(probes)).observe(recall)
+        SHADOW_SEARCH_SECONDS.labels("ann").observe(ann_seconds)
+        SHADOW_SEARCH_SECONDS.labels("exact").observe(exact_seconds)
+        SHADOW_SAMPLES.labels("measured").inc()
+    except Exception as e:
+        SHADOW_SAMPLES.labels("error").inc()
+        logger.warning(f"Shadow exact search failed for {user_id}: {e}")
+    finally:
+        with _pending_lock:
+            _pending -= 1
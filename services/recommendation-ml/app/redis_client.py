@@ -1,7 +1,8 @@
-import json
 import logging
+import uuid
 from typing import Optional
 
+import numpy as np
 import redis
 
 from .config import settings
@@ -9,6 +10,12 @@ from .config import settings
 logger = logging.getLogger(__name__)
 
 _client: Optional[redis.Redis] = None
+_binary_client: Optional[redis.Redis] = None
+
+# Candidate lists (ranked-list cache, co-visitation lists) are stored as one
+# fixed-size record per candidate: raw UUID + score quantized to 1/65535, so
+# a slice of a list is a single GETRANGE at offset * itemsize
+RECORD = np.dtype([("id", "V16"), ("score", ">u2")])
 
 
 def get_redis() -> redis.Redis:
@@ -19,27 +26,45 @@ def get_redis() -> redis.Redis:
             settings.redis_url,
             decode_responses=True,
             socket_connect_timeout=5,
+            socket_timeout=settings.redis_socket_timeout,
             socket_keepalive=True,
         )
     return _client
 
 
-def cache_recommendations(user_id: str, recs: list[dict], ttl: int = 0):
-    """Cache recommendation results in Redis."""
-    ttl = ttl or settings.ml_recs_cache_ttl
-    key = f"ml_recs:{user_id}"
-    r = get_redis()
-    r.set(key, json.dumps(recs), ex=ttl)
+def get_binary_redis() -> redis.Redis:
+    """Redis client without response decoding, for compact binary values."""
+    global _binary_client
+    if _binary_client is None:
+        _binary_client = redis.from_url(
+            settings.redis_url,
+            decode_responses=False,
+            socket_connect_timeout=5,
+            socket_timeout=settings.redis_socket_timeout,
+            socket_keepalive=True,
+        )
+    return _binary_client
 
 
-def get_cached_recommendations(user_id: str) -> Optional[list[dict]]:
-    """Get cached recommendations from Redis."""
-    key = f"ml_recs:{user_id}"
-    r = get_redis()
-    raw = r.get(key)
-    if raw:
-        return json.loads(raw)
-    return None
+def encode_records(ids, scores) -> bytes:
+    """Pack raw 16-byte UUIDs and 0-1 scores into RECORDs."""
+    records = np.empty(len(ids), dtype=RECORD)
+    records["id"] = ids
+    records["score"] = np.round(np.clip(scores, 0.0, 1.0) * 65535)
+    return records.tobytes()
+
+
+def encode_ranked(recs: list[dict]) -> bytes:
+    return encode_records([uuid.UUID(r["user_id"]).bytes for r in recs], [r["score"] for r in recs])
+
+
+def decode_ranked(raw: bytes) -> list[dict]:
+    records = np.frombuffer(raw, dtype=RECORD, count=len(raw) // RECORD.itemsize)
+    scores = (records["score"] / 65535).round(4).tolist()
+    return [
+        {"user_id": str(uuid.UUID(bytes=bytes(rid))), "score": score}
+        for rid, score in zip(records["id"], scores)
+    ]
 
 
 def invalidate_all_recs():
@@ -0,0 +1,89 @@
+"""
+Decode cost per image: full decode + resize vs reduced-size decode.
+
+Encodes synthetic photos at several resolutions, then times
+`Image.open(...).convert("RGB").resize(256)` (the old path) against
+`image_ingest.decode_for_model` (JPEG draft / box reduce). Memory is the
+size of the largest decoded RGB buffer, since Pillow allocates outside
+tracemalloc's view.
+
+    python -m benchmarks.bench_image_decode [--json out.json]
+"""
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.image_ingest import DECODE_SIZE, decode_for_model
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024), (6000, 4000)]
+
+
+def _synthetic_photo(width: int, height: int, fmt: str) -> bytes:
+    # Smooth gradients + noise compress like a photo, unlike pure noise
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format=fmt, quality=90)
+    return buf.getvalue()
+
+
+def _full_decode(data: bytes) -> tuple[Image.Image, tuple[int, int]]:
+    decoded = Image.open(io.BytesIO(data)).convert("RGB")
+    return decoded.resize((DECODE_SIZE, DECODE_SIZE)), decoded.size
+
+
+def _reduced_decode(data: bytes) -> tuple[Image.Image, tuple[int, int]]:
+    image = Image.open(io.BytesIO(data))
+    if image.format == "JPEG":
+        image.draft("RGB", (DECODE_SIZE, DECODE_SIZE))
+    decoded_size = image.size  # what the decoder actually materialises
+    return decode_for_model(data).resize((DECODE_SIZE, DECODE_SIZE)), decoded_size
+
+
+def _measure(fn, data: bytes, repeats: int) -> dict:
+    _, (width, height) = fn(data)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(data)
+    elapsed = (time.perf_counter() - start) / repeats
+    return {"ms": round(elapsed * 1000, 2), "peak_mb": round(width * height * 3 / 2**20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image decode cost: full vs reduced-size")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for fmt in ("JPEG", "PNG"):
+        for width, height in RESOLUTIONS:
+            data = _synthetic_photo(width, height, fmt)
+            full = _measure(_full_decode, data, args.repeats)
+            reduced = _measure(_reduced_decode, data, args.repeats)
+            results.append({
+                "format": fmt,
+                "resolution": f"{width}x{height}",
+                "bytes": len(data),
+                "full": full,
+                "reduced": reduced,
+                "speedup": round(full["ms"] / max(reduced["ms"], 1e-6), 1),
+            })
+            print(f"{fmt:4s} {width:>5d}x{height:<5d} full {full['ms']:8.2f}ms {full['peak_mb']:7.2f}MB"
+                  f"  reduced {reduced['ms']:7.2f}ms {reduced['peak_mb']:6.2f}MB"
+                  f"  ({results[-1]['speedup']}x)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+NSFW model throughput (images/sec) by batch size on CPU.
+
+Feeds random preprocessed inputs straight into `nsfw_worker.forward` in
+this process, so only the model forward pass is measured (no pool IPC).
+Needs opennsfw2 + TensorFlow installed; the weights are downloaded on first run.
+
+    CUDA_VISIBLE_DEVICES= python -m benchmarks.bench_nsfw_batch [--json out.json]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.nsfw_worker import forward, load_model
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+
+def bench(batch_size: int, images: int, rng: np.random.Generator) -> dict:
+    batch = rng.uniform(-123, 152, size=(batch_size, 224, 224, 3)).astype(np.float32)
+    forward(batch)  # warm-up (graph tracing for this shape)
+    calls = max(1, images // batch_size)
+    start = time.perf_counter()
+    for _ in range(calls):
+        forward(batch)
+    elapsed = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "images": calls * batch_size,
+        "images_per_s": round(calls * batch_size / elapsed, 2),
+        "ms_per_batch": round(elapsed / calls * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NSFW model throughput by batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--images", type=int, default=256, help="images per batch size")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    load_model()
+    rng = np.random.default_rng(0)
+    results = []
+    for batch_size in args.batch_sizes:
+        row = bench(batch_size, args.images, rng)
+        results.append(row)
+        print(f"batch {row['batch_size']:3d}  {row['images_per_s']:8.2f} img/s  {row['ms_per_batch']:8.2f} ms/batch")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+In-process stand-ins for the two pgvector search modes.
+
+`exact_topk` is the brute-force scan Postgres does without an index;
+`IVFFlat` mirrors pgvector's ivfflat (spherical k-means lists built from a
+sample, `probes` nearest lists scanned at query time) so ANN latency and
+recall can be measured without a database.
+"""
+import numpy as np
+from sklearn.cluster import KMeans
+
+
+def exact_topk(vectors: np.ndarray, query: np.ndarray, k: int, exclude: int = -1) -> np.ndarray:
+    """Indices of the k most cosine-similar rows (vectors are L2-normalized)."""
+    scores = vectors @ query
+    if exclude >= 0:
+        scores[exclude] = -np.inf
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class IVFFlat:
+    def __init__(self, lists: int = 100, probes: int = 1, seed: int = 42):
+        self.lists = lists
+        self.probes = probes
+        self.seed = seed
+
+    def build(self, vectors: np.ndarray) -> "IVFFlat":
+        # pgvector samples 50 rows per list to train the centroids
+        rng = np.random.default_rng(self.seed)
+        lists = min(self.lists, len(vectors))
+        sample_size = min(len(vectors), lists * 50)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        km = KMeans(n_clusters=lists, n_init=1, max_iter=20, random_state=self.seed).fit(sample)
+        centroids = km.cluster_centers_.astype(vectors.dtype)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms > 0, norms, 1)
+
+        # Assign in chunks to bound the (n x lists) score matrix
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 65536):
+            chunk = vectors[start:start + 65536]
+            assign[start:start + 65536] = np.argmax(chunk @ self.centroids.T, axis=1)
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(lists + 1))
+        self.vectors = vectors[self.order]
+        return self
+
+    def search(self, query: np.ndarray, k: int, exclude: int = -1) -> np.ndarray:
+        probes = min(self.probes, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+        spans = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in nearest]
+        rows = np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+        if not len(rows):
+            return rows
+        scores = self.vectors[rows] @ query
+        ids = self.order[rows]
+        if exclude >= 0:
+            scores[ids == exclude] = -np.inf
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return ids[top[np.argsort(-scores[top])]]
+
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray) -> float:
+    if not len(exact):
+        return 1.0
+    return len(np.intersect1d(approx, exact)) / len(exact)
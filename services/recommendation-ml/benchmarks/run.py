@@ -0,0 +1,478 @@
+"""
+Offline benchmark suite for recommendation-ml (no Postgres, Redis or Kafka).
+
+Runs the engine's training stages on synthetic data (matrix build, SVD,
+feature build, embedding combine), then retrieval (exact scan vs IVFFlat
+with recall@K), compact embedding storage (float16 / int8 vs float32), the
+reciprocal re-rank, the co-visitation candidate build and the
+recommendation cache encode/decode path, at each requested scale.
+Results go to JSON tagged with the git commit so runs can be compared
+across commits.
+
+    cd services/recommendation-ml
+    python -m benchmarks.run                              # 10k, 100k, 1M users
+    python -m benchmarks.run --scales 10000 --compare benchmarks/results/<old>.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy
+import sklearn
+
+from app.config import settings
+from app.engine import (
+    _combine_embeddings,
+    _factorize,
+    _features_from_rows,
+    _matrix_from_rows,
+    reciprocal_scores,
+)
+from app.database import ivf_lists
+from app.covisitation import build_candidates, segment_filter
+from app.redis_client import RECORD, decode_ranked, encode_ranked
+
+from .ivf import IVFFlat, exact_topk, recall_at_k
+from .synthetic import SyntheticConfig, generate
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _percentiles_ms(samples: list[float]) -> dict:
+    arr = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(arr, 50)), 4),
+        "p99_ms": round(float(np.percentile(arr, 99)), 4),
+        "mean_ms": round(float(arr.mean()), 4),
+    }
+
+
+def _peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS; for RUSAGE_CHILDREN it is the
+    # largest single reaped child so far, not a sum
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def bench_retrieval(vectors: np.ndarray, queries: np.ndarray, k: int, lists: int, probes: int) -> dict:
+    exact_lat, ann_lat, recalls = [], [], []
+    index, build_s = _timed(IVFFlat(lists=lists, probes=probes).build, vectors)
+    for q in queries:
+        exact, t = _timed(exact_topk, vectors, vectors[q], k, exclude=q)
+        exact_lat.append(t)
+        approx, t = _timed(index.search, vectors[q], k, exclude=q)
+        ann_lat.append(t)
+        recalls.append(recall_at_k(approx, exact))
+    return {
+        "k": k,
+        "queries": len(queries),
+        "exact": _percentiles_ms(exact_lat),
+        "ann": {
+            "lists": lists,
+            "probes": probes,
+            "build_s": round(build_s, 3),
+            **_percentiles_ms(ann_lat),
+            f"recall_at_{k}": round(float(np.mean(recalls)), 4),
+        },
+    }
+
+
+def bench_segmented_retrieval(
+    vectors: np.ndarray,
+    segments: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    lists: int,
+    probes: int,
+) -> dict:
+    """
+    One global index + post-filter to compatible segments (old path) vs one
+    index per segment searched directly (partial-index path). Recall is
+    against the exact top-k within the compatible segment.
+    """
+    compatibility = settings.segment_compatibility
+    global_index = IVFFlat(lists=lists, probes=probes).build(vectors)
+    members, indexes = {}, {}
+    for segment in np.unique(segments):
+        rows = np.flatnonzero(segments == segment)
+        members[segment] = rows
+        # Partial indexes keep lists=100 each, so lists get proportionally smaller
+        indexes[segment] = IVFFlat(lists=min(lists, len(rows)), probes=probes).build(vectors[rows])
+
+    global_lat, seg_lat, global_recall, seg_recall, kept = [], [], [], [], []
+    for q in queries:
+        targets = compatibility.get(str(segments[q]), [])
+        allowed = np.concatenate([members[t] for t in targets if t in members]) if targets else np.empty(0, int)
+        if not len(allowed):
+            continue
+        exact = allowed[exact_topk(vectors[allowed], vectors[q], k)]
+
+        approx, t = _timed(global_index.search, vectors[q], k, exclude=q)
+        global_lat.append(t)
+        compatible = approx[np.isin(approx, allowed)]
+        kept.append(len(compatible) / max(1, len(approx)))
+        global_recall.append(recall_at_k(compatible, exact))
+
+        start = time.perf_counter()
+        merged = []
+        for target in targets:
+            found = indexes[target].search(vectors[q], k)
+            merged.append(members[target][found])
+        merged = np.concatenate(merged)
+        approx = merged[np.argsort(-(vectors[merged] @ vectors[q]))[:k]]
+        seg_lat.append(time.perf_counter() - start)
+        seg_recall.append(recall_at_k(approx, exact))
+
+    return {
+        "k": k,
+        "queries": len(global_lat),
+        "global_filtered": {
+            **_percentiles_ms(global_lat),
+            "compatible_fraction": round(float(np.mean(kept)), 4),
+            f"recall_at_{k}": round(float(np.mean(global_recall)), 4),
+        },
+        "per_segment": {
+            **_percentiles_ms(seg_lat),
+            f"recall_at_{k}": round(float(np.mean(seg_recall)), 4),
+        },
+    }
+
+
+# Bytes per stored embedding in Postgres: 8-byte header + elements
+# (int8 has no pgvector type; it is measured here as the next step down)
+STORAGE_MODES = {"float32": 4, "float16": 2, "int8": 1}
+
+
+def _quantize(vectors: np.ndarray, mode: str) -> tuple[np.ndarray, np.ndarray]:
+    """(stored, per-dimension scale); stored * scale is what the search sees."""
+    scale = np.ones(vectors.shape[1], dtype=np.float32)
+    if mode == "float16":
+        return vectors.astype(np.float16), scale
+    if mode == "int8":
+        # Symmetric per-dimension scale, recomputed for every model generation
+        scale = np.abs(vectors).max(axis=0) / 127
+        scale[scale == 0] = 1.0
+        return np.clip(np.round(vectors / scale), -127, 127).astype(np.int8), scale
+    return vectors, scale
+
+
+def _scan(stored: np.ndarray, query: np.ndarray, k: int, exclude: int, block: int = 16384) -> np.ndarray:
+    # Widen one block at a time, like pgvector reading halfvec pages, so the
+    # timing includes the conversion and reads the compact array
+    scores = np.empty(len(stored), dtype=np.float32)
+    for start in range(0, len(stored), block):
+        scores[start:start + block] = stored[start:start + block].astype(np.float32, copy=False) @ query
+    scores[exclude] = -np.inf
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def bench_storage(vectors: np.ndarray, queries: np.ndarray, k: int, lists: int, probes: int) -> dict:
+    """
+    Compact embedding storage vs float32: size, exact-scan and IVFFlat
+    latency, and recall@K against the float32 exact top-K (so the numbers
+    include both quantization and ANN loss). For int8 the query is scaled
+    by the per-dimension scales, so the scan multiplies raw codes.
+    numpy widens float16 in software, so the float16 scan time is an upper
+    bound; pgvector converts with F16C and its scans are page-bound, which
+    `row_bytes` tracks. IVFFlat latency is on decoded vectors (recall only).
+    """
+    truth = {q: exact_topk(vectors, vectors[q], k, exclude=q) for q in queries}
+    report = {}
+    for mode, width in STORAGE_MODES.items():
+        stored, scale = _quantize(vectors, mode)
+        decoded = stored.astype(np.float32) * scale
+        index = IVFFlat(lists=lists, probes=probes).build(decoded)
+        exact_lat, ann_lat, exact_recall, ann_recall = [], [], [], []
+        for q in queries:
+            found, t = _timed(_scan, stored, decoded[q] * scale, k, q)
+            exact_lat.append(t)
+            exact_recall.append(recall_at_k(found, truth[q]))
+            found, t = _timed(index.search, decoded[q], k, exclude=q)
+            ann_lat.append(t)
+            ann_recall.append(recall_at_k(found, truth[q]))
+        report[mode] = {
+            "row_bytes": 8 + width * vectors.shape[1],
+            "ram_mb": round(stored.nbytes / 2**20, 2),
+            "exact": {**_percentiles_ms(exact_lat), f"recall_at_{k}": round(float(np.mean(exact_recall)), 4)},
+            "ann": {**_percentiles_ms(ann_lat), f"recall_at_{k}": round(float(np.mean(ann_recall)), 4)},
+        }
+    base = report["float32"]
+    for mode, entry in report.items():
+        entry["size_ratio"] = round(entry["row_bytes"] / base["row_bytes"], 3)
+        entry["exact_speedup"] = round(base["exact"]["p50_ms"] / entry["exact"]["p50_ms"], 2)
+        entry["ann_recall_loss"] = round(base["ann"][f"recall_at_{k}"] - entry["ann"][f"recall_at_{k}"], 4)
+    return report
+
+
+def bench_covisitation(matrix, segments: np.ndarray, workers: list[int]) -> dict:
+    """
+    Co-visitation build time per worker count, link/list sizes and peak RSS.
+    Spawned workers each hold a copy of the shared matrices, so the total is
+    estimated as parent peak + workers x largest worker peak (RUSAGE_CHILDREN
+    only reports the largest child, and never decreases across runs).
+    """
+    codes, allowed = segment_filter([str(s) for s in segments])
+    report = {}
+    for count in workers:
+        candidates, stats = build_candidates(matrix, codes, allowed, workers=count)
+        stats["lists_mb"] = round(candidates.nnz * RECORD.itemsize / 2**20, 2)
+        stats["peak_rss_mb"] = _peak_rss_mb()
+        stats["worker_peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN) if stats["workers"] > 1 else 0.0
+        stats["est_total_rss_mb"] = round(stats["peak_rss_mb"] + stats["workers"] * stats["worker_peak_rss_mb"], 1)
+        report[f"workers_{count}"] = stats
+    return report
+
+
+def bench_reciprocal(
+    vectors: np.ndarray,
+    latent: np.ndarray,
+    targets: np.ndarray,
+    matrix,
+    segments: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    overfetch: int,
+    weight: float,
+) -> dict:
+    """
+    Cost of the reciprocal re-rank on k * overfetch exact candidates from
+    the compatible segments (what the partitioned k-NN returns): the deeper
+    IVFFlat search itself (k vs k * overfetch, lists and depth-scaled probes
+    as engine.ivfflat_probes picks them), the forward/reverse dot products
+    (done by Postgres in production, over the raw U·Σ / V factor rows) plus
+    the blend. Reciprocity is the
+    share of the top-k who already acted on the viewer (matrix[c, u] > 0),
+    before and after re-ranking. Not covered: Postgres shipping the extra
+    rows and forward/reverse columns back to the service.
+    """
+    incoming = (matrix.T.tocsr() > 0)
+    indexes = {}
+    knn_lat, deep_lat, dot_lat, blend_lat, before, after = [], [], [], [], [], []
+    for q in queries:
+        targets_of = settings.segment_compatibility.get(str(segments[q]))
+        allowed = np.flatnonzero(np.isin(segments, targets_of)) if targets_of else np.arange(len(vectors))
+        if len(allowed) < k * overfetch:
+            continue
+        key = tuple(targets_of) if targets_of else None
+        if key not in indexes:
+            indexes[key] = IVFFlat(lists=ivf_lists(len(allowed))).build(vectors[allowed])
+        index = indexes[key]
+        for depth, lat in ((k, knn_lat), (k * overfetch, deep_lat)):
+            needed = math.ceil(settings.ivfflat_probe_margin * depth * index.lists / len(allowed))
+            index.probes = max(settings.ivfflat_probes or 1, min(index.lists, needed))
+            lat.append(_timed(index.search, vectors[q], depth)[1])
+        cands = allowed[exact_topk(vectors[allowed], vectors[q], k * overfetch)]
+        scores = np.clip((vectors[cands] @ vectors[q] + 1) / 2, 0.0, 1.0)
+        start = time.perf_counter()
+        forward = targets[cands] @ latent[q]
+        reverse = latent[cands] @ targets[q]
+        dot_lat.append(time.perf_counter() - start)
+        reranked, t = _timed(reciprocal_scores, scores, forward, reverse, weight)
+        top = cands[np.argsort(-reranked, kind="stable")[:k]]
+        blend_lat.append(t)
+        liked_me = set(incoming[q].indices)
+        before.append(np.mean([c in liked_me for c in cands[:k]]))
+        after.append(np.mean([c in liked_me for c in top]))
+    return {
+        "k": k,
+        "queries": len(dot_lat),
+        "candidates": k * overfetch,
+        "blend": weight,
+        "knn": _percentiles_ms(knn_lat),
+        "knn_overfetch": _percentiles_ms(deep_lat),
+        "affinity": _percentiles_ms(dot_lat),
+        "rerank": _percentiles_ms(blend_lat),
+        "reciprocity_before": round(float(np.mean(before)), 4),
+        "reciprocity_after": round(float(np.mean(after)), 4),
+    }
+
+
+def bench_cache_codec(user_ids: list[str], scores: np.ndarray, depth: int, page: int, iterations: int) -> dict:
+    """Ranked-list cache: size vs JSON, full encode, and decoding one page slice."""
+    recs = [{"user_id": uid, "score": round(float(s), 4)} for uid, s in zip(user_ids[:depth], scores[:depth])]
+    encoded = encode_ranked(recs)
+    page_bytes = encoded[:page * RECORD.itemsize]
+    _, enc_s = _timed(lambda: [encode_ranked(recs) for _ in range(iterations)])
+    _, dec_s = _timed(lambda: [decode_ranked(page_bytes) for _ in range(iterations)])
+    return {
+        "recs": len(recs),
+        "bytes": len(encoded),
+        "json_bytes": len(json.dumps(recs)),
+        "encode_us": round(enc_s / iterations * 1e6, 2),
+        "page_decode_us": round(dec_s / iterations * 1e6, 2),
+    }
+
+
+def run_scale(n_users: int, args) -> dict:
+    print(f"== {n_users:,} users")
+    data, gen_s = _timed(generate, SyntheticConfig(n_users=n_users, seed=args.seed))
+    print(f"   generated {data.n_swipes:,} swipes, {data.n_events:,} events in {gen_s:.1f}s")
+    stages = {}
+
+    (matrix, row_users, _), stages["matrix_build_s"] = _timed(
+        _matrix_from_rows, data.iter_swipe_rows(), data.iter_behavior_rows(),
+    )
+    (latent, targets), stages["svd_s"] = _timed(_factorize, matrix)
+    features, stages["feature_build_s"] = _timed(
+        _features_from_rows, row_users, data.user_rows(), data.iter_tag_rows(),
+    )
+    embeddings, stages["combine_s"] = _timed(_combine_embeddings, row_users, latent, features)
+    for key, value in stages.items():
+        print(f"   {key:18s} {value:8.2f}s")
+
+    vectors = np.stack([embeddings[uid] for uid in row_users]).astype(np.float32)
+    del embeddings, features
+
+    rng = np.random.default_rng(args.seed)
+    queries = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    lists = args.lists or max(10, min(1000, len(vectors) // 1000))
+    retrieval = bench_retrieval(vectors, queries, args.k, lists, args.probes)
+    print(f"   exact p50 {retrieval['exact']['p50_ms']}ms, ann p50 {retrieval['ann']['p50_ms']}ms, "
+          f"recall@{args.k} {retrieval['ann'][f'recall_at_{args.k}']}")
+
+    position = {uid: i for i, uid in enumerate(data.user_ids)}
+    segments = data.segments()[[position[uid] for uid in row_users]]
+    segmented = bench_segmented_retrieval(vectors, segments, queries, args.k, lists, args.probes)
+    print(f"   global+filter keeps {segmented['global_filtered']['compatible_fraction']:.0%} of top-{args.k} "
+          f"(recall {segmented['global_filtered'][f'recall_at_{args.k}']}), per-segment recall "
+          f"{segmented['per_segment'][f'recall_at_{args.k}']} p50 {segmented['per_segment']['p50_ms']}ms")
+
+    storage = bench_storage(vectors, queries, args.k, lists, args.probes)
+    for mode, entry in storage.items():
+        print(f"   {mode:8s} {entry['row_bytes']}B/row, exact p50 {entry['exact']['p50_ms']}ms "
+              f"({entry['exact_speedup']}x), ann recall@{args.k} {entry['ann'][f'recall_at_{args.k}']} "
+              f"(loss {entry['ann_recall_loss']})")
+
+    # Served lists are ranked_list_depth deep, re-ranked from reciprocal_overfetch x that
+    depth = settings.ranked_list_depth
+    reciprocal = bench_reciprocal(
+        vectors, latent, targets, matrix, segments, queries, depth, settings.reciprocal_overfetch, 0.5,
+    )
+    print(f"   reciprocal rerank of {reciprocal['candidates']}: k-NN p99 {reciprocal['knn']['p99_ms']}ms -> "
+          f"{reciprocal['knn_overfetch']['p99_ms']}ms over-fetched, rerank p99 "
+          f"{reciprocal['affinity']['p99_ms'] + reciprocal['rerank']['p99_ms']:.4f}ms, reciprocity@{depth} "
+          f"{reciprocal['reciprocity_before']} -> {reciprocal['reciprocity_after']}")
+
+    covisit = bench_covisitation(matrix, segments, sorted({1, os.cpu_count() or 1}))
+    for name, entry in covisit.items():
+        print(f"   covisit {name:10s} build {entry['build_s']}s (links {entry['links_s']}s), "
+              f"links {entry['links_mb']}MB, lists {entry['lists_mb']}MB, "
+              f"{entry['users_with_candidates']:,} users with candidates, "
+              f"{entry['workers']} workers, RSS ~{entry['est_total_rss_mb']}MB")
+
+    scores = rng.random(len(row_users))
+    cache = bench_cache_codec(row_users, scores, settings.ranked_list_depth, args.k, iterations=2000)
+
+    return {
+        "users": len(row_users),
+        "swipes": data.n_swipes,
+        "events": data.n_events,
+        "matrix_nnz": int(matrix.nnz),
+        "generate_s": round(gen_s, 3),
+        **{k: round(v, 3) for k, v in stages.items()},
+        "embeddings_mb": round(vectors.nbytes / 2**20, 1),
+        "retrieval": retrieval,
+        "segmented_retrieval": segmented,
+        "storage": storage,
+        "reciprocal": reciprocal,
+        "covisitation": covisit,
+        "cache": cache,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _flatten(d: dict, prefix: str = "") -> dict:
+    out = {}
+    for key, value in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            out[name] = value
+    return out
+
+
+def compare(current: dict, baseline: dict):
+    """Print metric ratios current/baseline for scales present in both runs."""
+    print(f"\nvs {baseline['meta']['commit']} ({baseline['meta']['timestamp']})")
+    for scale, result in current["scales"].items():
+        base = baseline["scales"].get(scale)
+        if not base:
+            continue
+        cur_flat, base_flat = _flatten(result), _flatten(base)
+        print(f"== {int(scale):,} users")
+        for key, value in cur_flat.items():
+            old = base_flat.get(key)
+            if old:
+                print(f"   {key:36s} {old:>12g} -> {value:>12g}  ({value / old:6.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recommendation-ml benchmarks")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries per scale")
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--lists", type=int, default=0, help="IVFFlat lists (default rows/1000)")
+    parser.add_argument("--probes", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="result JSON path (default results/bench-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="baseline result JSON to diff against")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    now = datetime.now(timezone.utc)
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": now.isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "sklearn": sklearn.__version__,
+            "cpus": os.cpu_count(),
+            "machine": platform.machine(),
+        },
+        "scales": {},
+    }
+    for n_users in args.scales:
+        report["scales"][str(n_users)] = run_scale(n_users, args)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"bench-{commit}-{now:%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Synthetic interaction data shaped like production traffic.
+
+Activity (swipes per user) follows a Pareto distribution and attention
+(swipes received) a Zipf distribution over a random popularity ranking,
+so a few profiles collect most likes and most users swipe a little.
+Swipes go mostly across segments (sugar_daddy <-> sugar_baby).
+
+Rows are produced lazily in the same dict shape the DB cursors return,
+so the engine's row-consuming functions run unchanged and memory stays
+bounded at 1M users.
+"""
+import uuid
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+SWIPE_ACTIONS = np.array(["like", "pass", "super_like"])
+SWIPE_ACTION_P = np.array([0.40, 0.55, 0.05])
+BEHAVIOR_EVENTS = np.array(["view_detail", "view_photo", "dwell_card", "dwell_detail"])
+BEHAVIOR_EVENT_P = np.array([0.35, 0.30, 0.25, 0.10])
+TAG_CATEGORIES = ["lifestyle", "interests", "expectations", "personality"]
+TAGS_PER_CATEGORY = 25
+
+
+@dataclass
+class SyntheticConfig:
+    n_users: int
+    swipes_per_user: float = 20.0
+    events_per_user: float = 10.0
+    tags_per_user: float = 6.0
+    daddy_share: float = 0.3
+    cross_segment_share: float = 0.9
+    activity_alpha: float = 1.5   # Pareto shape for outgoing activity
+    popularity_s: float = 0.8     # Zipf exponent for received attention
+    tag_popularity_s: float = 1.1
+    verified_share: float = 0.35
+    seed: int = 42
+
+
+@dataclass
+class SyntheticData:
+    config: SyntheticConfig
+    user_ids: list[str]
+    is_daddy: np.ndarray
+    swipe_src: np.ndarray
+    swipe_dst: np.ndarray
+    swipe_action: np.ndarray
+    event_src: np.ndarray
+    event_dst: np.ndarray
+    event_type: np.ndarray
+    event_weight: np.ndarray
+    birth_days: np.ndarray
+    account_days: np.ndarray
+    verified: np.ndarray
+    tag_user: np.ndarray
+    tag_id: np.ndarray
+    _today: date = field(default_factory=date.today)
+
+    @property
+    def n_swipes(self) -> int:
+        return len(self.swipe_src)
+
+    @property
+    def n_events(self) -> int:
+        return len(self.event_src)
+
+    def iter_swipe_rows(self) -> Iterator[dict]:
+        ids = self.user_ids
+        for s, d, a in zip(self.swipe_src.tolist(), self.swipe_dst.tolist(), self.swipe_action.tolist()):
+            yield {"swiperId": ids[s], "swipedId": ids[d], "action": SWIPE_ACTIONS[a]}
+
+    def iter_behavior_rows(self) -> Iterator[dict]:
+        ids = self.user_ids
+        for s, d, t, w in zip(
+            self.event_src.tolist(), self.event_dst.tolist(),
+            self.event_type.tolist(), self.event_weight.tolist(),
+        ):
+            yield {"userId": ids[s], "targetUserId": ids[d], "eventType": BEHAVIOR_EVENTS[t], "weight": w}
+
+    def iter_tag_rows(self) -> Iterator[dict]:
+        ids = self.user_ids
+        for u, t in zip(self.tag_user.tolist(), self.tag_id.tolist()):
+            category = TAG_CATEGORIES[t // TAGS_PER_CATEGORY]
+            yield {"userId": ids[u], "category": category, "name": f"{category}-{t}", "tag_id": t}
+
+    def user_rows(self) -> Mapping:
+        """`users` rows keyed by id, built on access like the engine's dict lookup."""
+        return _UserRows(self)
+
+    def segments(self) -> np.ndarray:
+        return np.where(self.is_daddy, "sugar_daddy", "sugar_baby")
+
+
+class _UserRows(Mapping):
+    def __init__(self, data: SyntheticData):
+        self._data = data
+        self._index = {uid: i for i, uid in enumerate(data.user_ids)}
+
+    def __getitem__(self, uid: str) -> dict:
+        i = self._index[uid]
+        d = self._data
+        return {
+            "id": uid,
+            "userType": "sugar_daddy" if d.is_daddy[i] else "sugar_baby",
+            "birthDate": d._today - timedelta(days=int(d.birth_days[i])),
+            "verificationStatus": "verified" if d.verified[i] else "unverified",
+            "createdAt": datetime.now() - timedelta(days=int(d.account_days[i])),
+        }
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+def _zipf_weights(n: int, s: float, rng: np.random.Generator) -> np.ndarray:
+    """Zipf weights over a random ranking of n items."""
+    ranks = rng.permutation(n) + 1
+    w = 1.0 / ranks.astype(np.float64) ** s
+    return w / w.sum()
+
+
+def _sample_targets(src: np.ndarray, is_daddy: np.ndarray, popularity: np.ndarray,
+                    cross_share: float, rng: np.random.Generator) -> np.ndarray:
+    """Pick a target per source: mostly from the opposite segment, by popularity."""
+    n = len(is_daddy)
+    pools = {flag: np.flatnonzero(is_daddy == flag) for flag in (True, False)}
+    cdfs = {}
+    for flag, pool in pools.items():
+        w = popularity[pool]
+        cdfs[flag] = np.cumsum(w / w.sum())
+
+    want_daddy = is_daddy[src] ^ (rng.random(len(src)) < cross_share)
+    dst = np.empty(len(src), dtype=np.int64)
+    for flag, pool in pools.items():
+        mask = want_daddy == flag
+        if not len(pool):
+            dst[mask] = rng.integers(0, n, mask.sum())
+            continue
+        picks = np.searchsorted(cdfs[flag], rng.random(mask.sum()), side="right")
+        dst[mask] = pool[np.minimum(picks, len(pool) - 1)]
+    return dst
+
+
+def _activity_counts(n: int, mean: float, alpha: float, rng: np.random.Generator) -> np.ndarray:
+    activity = rng.pareto(alpha, n) + 1.0
+    return rng.poisson(activity * (mean / activity.mean()))
+
+
+def generate(config: SyntheticConfig) -> SyntheticData:
+    """Generate users, swipes, behavior events and tags for `config.n_users` users."""
+    rng = np.random.default_rng(config.seed)
+    n = config.n_users
+
+    raw = rng.integers(0, 2**63, size=(n, 2), dtype=np.int64).view(np.uint64)
+    user_ids = [str(uuid.UUID(int=(int(hi) << 64) | int(lo), version=4)) for hi, lo in raw]
+    is_daddy = rng.random(n) < config.daddy_share
+    popularity = _zipf_weights(n, config.popularity_s, rng)
+
+    counts = _activity_counts(n, config.swipes_per_user, config.activity_alpha, rng)
+    swipe_src = np.repeat(np.arange(n), counts)
+    swipe_dst = _sample_targets(swipe_src, is_daddy, popularity, config.cross_segment_share, rng)
+    keep = swipe_src != swipe_dst
+    swipe_src, swipe_dst = swipe_src[keep], swipe_dst[keep]
+    swipe_action = rng.choice(len(SWIPE_ACTIONS), size=len(swipe_src), p=SWIPE_ACTION_P)
+
+    counts = _activity_counts(n, config.events_per_user, config.activity_alpha, rng)
+    event_src = np.repeat(np.arange(n), counts)
+    event_dst = _sample_targets(event_src, is_daddy, popularity, config.cross_segment_share, rng)
+    keep = event_src != event_dst
+    event_src, event_dst = event_src[keep], event_dst[keep]
+    event_type = rng.choice(len(BEHAVIOR_EVENTS), size=len(event_src), p=BEHAVIOR_EVENT_P)
+    event_weight = np.round(rng.lognormal(0.0, 0.5, len(event_src)), 3)
+
+    n_tags = len(TAG_CATEGORIES) * TAGS_PER_CATEGORY
+    tag_counts = np.minimum(rng.poisson(config.tags_per_user, n), n_tags)
+    tag_user = np.repeat(np.arange(n), tag_counts)
+    tag_cdf = np.cumsum(_zipf_weights(n_tags, config.tag_popularity_s, rng))
+    tag_id = np.minimum(np.searchsorted(tag_cdf, rng.random(len(tag_user)), side="right"), n_tags - 1)
+    # Drop duplicate (user, tag) pairs like the unique constraint would
+    pairs = np.unique(tag_user * n_tags + tag_id)
+    tag_user, tag_id = pairs // n_tags, pairs % n_tags
+
+    return SyntheticData(
+        config=config,
+        user_ids=user_ids,
+        is_daddy=is_daddy,
+        swipe_src=swipe_src,
+        swipe_dst=swipe_dst,
+        swipe_action=swipe_action,
+        event_src=event_src,
+        event_dst=event_dst,
+        event_type=event_type,
+        event_weight=event_weight,
+        birth_days=rng.integers(18 * 365, 65 * 365, n),
+        account_days=rng.integers(0, 3 * 365, n),
+        verified=rng.random(n) < config.verified_share,
+        tag_user=tag_user,
+        tag_id=tag_id,
+    )
@@ -0,0 +1,29 @@
+from app.covisitation import blend_candidates
+
+
+def _recs(scores: dict[str, float]) -> list[dict]:
+    return [{"user_id": uid, "score": score} for uid, score in scores.items()]
+
+
+# Vector scores sit in the narrow (similarity + 1) / 2 band; co-visitation spans 0-1
+VECTOR = _recs({f"v{i}": round(0.63 - i * 0.005, 4) for i in range(20)})
+COVISIT = _recs({"c0": 1.0, "c1": 0.8, "v15": 0.6, "v19": 0.5, "c2": 0.3})
+
+
+def test_zero_weight_returns_vector_list():
+    assert blend_candidates(VECTOR, COVISIT, 0.0, 10) == VECTOR[:10]
+
+
+def test_small_weight_keeps_top_vector_results():
+    blended = blend_candidates(VECTOR, COVISIT, 0.1, 20)
+    ids = [rec["user_id"] for rec in blended]
+    # A co-visitation-only candidate can't jump over the best vector hits
+    assert ids[:10] == [f"v{i}" for i in range(10)]
+    assert ids.index("c0") > 10
+
+
+def test_scores_stay_on_vector_scale():
+    blended = blend_candidates(VECTOR, COVISIT, 0.3, 20)
+    low, high = VECTOR[-1]["score"], VECTOR[0]["score"]
+    assert all(low <= rec["score"] <= high for rec in blended)
+    assert [rec["score"] for rec in blended] == sorted((rec["score"] for rec in blended), reverse=True)
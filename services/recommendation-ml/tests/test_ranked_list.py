@@ -0,0 +1,7 @@
+from app.ranked_list import get_page
+
+
+def test_non_positive_limit_returns_empty_page():
+    # Returns before touching Redis or the k-NN, and yields no cursor
+    assert get_page("00000000-0000-0000-0000-000000000001", 0) == ([], None, False)
+    assert get_page("00000000-0000-0000-0000-000000000001", -5) == ([], None, False)